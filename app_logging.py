@@ -0,0 +1,114 @@
+import atexit
+import json
+import logging
+import queue
+import time
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from flask import g, request, has_app_context, has_request_context
+from flask.logging import default_handler
+
+# Level of app.logger for each APP_ENV, unless LOG_LEVEL is set
+LEVELS = {'development': 'DEBUG', 'testing': 'WARNING', 'production': 'INFO'}
+
+# Attributes passed with extra= that are written out with the record
+EXTRA_FIELDS = ('status', 'duration_ms', 'queries')
+
+
+class RequestContextFilter(logging.Filter):
+    """Stamp records with the request they were logged in, while still on the request thread."""
+
+    def filter(self, record):
+        if has_app_context():
+            # g outlives the request, so records from the app context teardown still get the id
+            record.request_id = g.get('request_id')
+            started = g.get('_log_started')
+            if started is not None:
+                record.elapsed_ms = round((time.perf_counter() - started) * 1000, 3)
+        if has_request_context():
+            record.method = request.method
+            record.path = request.path
+        return True
+
+
+class StructuredQueueHandler(QueueHandler):
+    """QueueHandler that keeps records structured instead of formatting them to a string.
+
+    The message is merged with its arguments and the traceback turned into
+    text here, so nothing on the record refers to objects of the request.
+    """
+
+    def prepare(self, record):
+        record = logging.makeLogRecord(record.__dict__)
+        record.message = record.getMessage()
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg, record.args, record.exc_info = record.message, None, None
+        return record
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for field in ('request_id', 'method', 'path', 'elapsed_ms') + EXTRA_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def init_logging(app):
+    """Send app.logger through a queue to a background thread that writes JSON lines.
+
+    Request threads only put records on the queue; the file writes and
+    rotation happen on the listener thread. Configured with APP_ENV,
+    LOG_LEVEL and LOG_FILE; in development records also go to the console.
+    """
+    env = app.config.setdefault('APP_ENV', 'production')
+    level = app.config.setdefault('LOG_LEVEL', LEVELS.get(env, 'INFO'))
+    log_file = app.config.setdefault('LOG_FILE', 'armelo_app.log')
+
+    formatter = JSONFormatter()
+    file_handler = RotatingFileHandler(log_file, maxBytes=100000, backupCount=3, encoding='utf-8')
+    file_handler.setFormatter(formatter)
+    handlers = [file_handler]
+    if env == 'development':
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(formatter)
+        handlers.append(console_handler)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = StructuredQueueHandler(log_queue)
+    queue_handler.addFilter(RequestContextFilter())
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    app.logger.removeHandler(default_handler)
+    app.logger.addHandler(queue_handler)
+    app.logger.setLevel(level)
+    app.extensions['log_listener'] = listener
+
+    @app.before_request
+    def start_request_log():
+        g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex[:16]
+        g._log_started = time.perf_counter()
+
+    @app.after_request
+    def finish_request_log(response):
+        response.headers.setdefault('X-Request-ID', g.get('request_id', ''))
+        started = g.get('_log_started')
+        if started is not None:
+            app.logger.info('%s %s %s', request.method, request.full_path.rstrip('?'), response.status_code,
+                            extra={'status': response.status_code, 'duration_ms': round((time.perf_counter() - started) * 1000, 3),
+                                   'queries': g.get('_db_stats', {}).get('queries')})
+        return response
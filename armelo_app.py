@@ -1,24 +1,48 @@
-from flask import Flask, render_template, request, redirect, url_for, session, g, send_from_directory
+from flask import Flask, render_template, request, redirect, url_for, session, send_from_directory, make_response, jsonify
 from flask_talisman import Talisman
 from werkzeug.security import check_password_hash
-import logging
-from logging.handlers import RotatingFileHandler
 import sqlite3
+import hashlib
+import io
 import os
-
-from elo import diff_supermatch, calculate_elo_with_bonus, expected_elo_from_score, expected_score, binom_prediction
-
-DATABASE = 'database.db'
+from datetime import datetime, timezone
+from functools import lru_cache
+import numpy as np
+
+from app_logging import init_logging
+from db import db_execute, transaction, write_transaction, init_db, get_data_version, bump_data_version
+from elo import diff_supermatch, calculate_elo_with_bonus, expected_elo_from_score, expected_score, binom_prediction, build_prediction_tables, expected_score_batch, binom_prediction_batch, binom_prediction_outer, \
+    build_scoreline_tables, scoreline_prediction, scoreline_prediction_batch
+from formats import SUPERMATCH_FORMATS, K_BY_FORMAT
+from importer import import_results, ResultsImportError
+from match_log import CalibratedHistoryError, undo_match, rescore_match, snapshot_if_due, record_timeline, rating_timeline, recent_ratings
+from matchmaking import closest_pairs
+from metrics import init_metrics, timed
+from migrations import init_schema
+from roster import get_roster, get_ratings, fetch_ratings, update_roster, UnknownArmwrestlerError
+from win_matrix import get_win_matrix, MAX_MATRIX_SIZE
+
+# The elo calls made while serving requests show up in /metrics
+diff_supermatch, calculate_elo_with_bonus, expected_elo_from_score, expected_score, binom_prediction, scoreline_prediction = map(
+    timed, (diff_supermatch, calculate_elo_with_bonus, expected_elo_from_score, expected_score, binom_prediction, scoreline_prediction))
+expected_score_batch, binom_prediction_batch, binom_prediction_outer, scoreline_prediction_batch = map(
+    timed, (expected_score_batch, binom_prediction_batch, binom_prediction_outer, scoreline_prediction_batch))
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', '%%8hF$7ALEy8Msw2')
-
-handler = RotatingFileHandler('armelo_app.log', maxBytes=100000, backupCount=3)
-handler.setLevel(logging.DEBUG)
-formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(name)s - %(message)s")
-handler.setFormatter(formatter)
-app.logger.addHandler(handler)
-app.logger.setLevel(logging.DEBUG)
+app.config['DATABASE'] = os.environ.get('DATABASE', 'database.db')
+app.config['AUTO_MIGRATE'] = os.environ.get('AUTO_MIGRATE', '1') != '0'
+app.config['SLOW_REQUEST_MS'] = float(os.environ['SLOW_REQUEST_MS']) if os.environ.get('SLOW_REQUEST_MS') else None
+app.config['APP_ENV'] = os.environ.get('APP_ENV', 'production')
+if os.environ.get('LOG_LEVEL'):
+    app.config['LOG_LEVEL'] = os.environ['LOG_LEVEL'].upper()
+if os.environ.get('LOG_FILE'):
+    app.config['LOG_FILE'] = os.environ['LOG_FILE']
+init_logging(app)
+init_db(app)
+init_metrics(app)
+
+init_schema(app)
 
 csp = {
     'default-src': [
@@ -58,15 +82,8 @@ csp = {
 # talisman = Talisman(app, content_security_policy=csp, content_security_policy_nonce_in=['script-src'])
 
 
-SUPERMATCH_FORMATS = {
-    "Single round": [1, 64, "Best of"],
-    "Best of 3": [3, 96, "Best of"],
-    "Best of 5": [5, 128, "Best of"],
-    "5 round match": [5, 144, "All rounds"],
-    "6 round Vendetta": [6 + 1, 144, "Vendetta"],
-    "Best of 7": [7, 144, "Best of"],
-    "10 round Speculative": [10, 128, "All rounds"],
-}
+build_prediction_tables({rounds for rounds, _, _ in SUPERMATCH_FORMATS.values()})
+build_scoreline_tables({(rounds, format_type) for rounds, _, format_type in SUPERMATCH_FORMATS.values()})
 
 
 @app.route('/robots.txt')
@@ -74,26 +91,6 @@ def serve_robots_txt():
     return send_from_directory(app.static_folder, 'robots.txt')
 
 
-def get_db():
-    db = getattr(g, '_database', None)
-    if db is None:
-        db = g._database = sqlite3.connect(DATABASE)
-    return db
-
-
-def db_execute(query, *args):
-    db = get_db()
-    cur = db.cursor()
-    cur.execute(query, args)
-    if query.strip().upper().startswith(("SELECT", "WITH")):
-        rv = cur.fetchall()
-        cur.close()
-        return rv
-    else:
-        db.commit()
-        cur.close()
-
-
 @app.context_processor
 def inject_user():
     username = session.get('username')
@@ -123,13 +120,99 @@ def logout():
     return redirect(url_for('ranking'))
 
 
+# arm -> (data version, page rendered for anonymous visitors)
+_ranking_cache = {}
+
+
+@app.template_filter('sparkline')
+def sparkline(elos, width=100, height=20):
+    """SVG polyline points for a list of elos."""
+    if len(elos) < 2:
+        return ''
+    low, high = min(elos), max(elos)
+    step = width / (len(elos) - 1)
+    return ' '.join(f'{index * step:.1f},{height - (elo - low) / ((high - low) or 1) * height:.1f}' for index, elo in enumerate(elos))
+
+
 @app.route("/")
 @app.route("/<any(right, left):arm>")
 def ranking(arm='right'):
-    order_by = 'right_elo' if arm == 'right' else 'left_elo'
-    armwrestlers = db_execute('SELECT DENSE_RANK() OVER (ORDER BY {0} DESC) AS rank, name, {0} FROM armwrestlers'.format(order_by))
+    version, updated_at = get_data_version()
     username = session.get('username')
-    return render_template('ranking.html', armwrestlers=armwrestlers, username=username, arm=arm)
+
+    etag = f'{arm}-{version}'
+    if username:
+        etag += '-' + hashlib.sha1(username.encode()).hexdigest()[:12]
+    if request.if_none_match.contains(etag):
+        return app.response_class(status=304, headers={'ETag': f'"{etag}"', 'Cache-Control': 'no-cache'})
+
+    cached = _ranking_cache.get(arm)
+    if cached is not None and cached[0] == version and not username:
+        html = cached[1]
+    else:
+        armwrestlers = get_roster().ranking(arm)
+        html = render_template('ranking.html', armwrestlers=armwrestlers, username=username, arm=arm)
+        if not username:
+            _ranking_cache[arm] = (version, html)
+
+    response = make_response(html)
+    response.set_etag(etag)
+    response.last_modified = datetime.strptime(updated_at, '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+@app.route("/sparkline/<any(right, left):arm>/<path:name>")
+def ranking_sparkline(arm, name):
+    """The trend of one ranking row, loaded once the row scrolls into view."""
+    if name not in get_roster():
+        return render_template('404.html'), 404
+
+    version, _ = get_data_version()
+    etag = f'{arm}-{version}-' + hashlib.sha1(name.encode()).hexdigest()[:12]
+    if request.if_none_match.contains(etag):
+        return app.response_class(status=304, headers={'ETag': f'"{etag}"', 'Cache-Control': 'no-cache'})
+
+    response = make_response(render_template('sparkline_partial.html', elos=recent_ratings(name, arm)))
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response
+
+
+def timeline_range():
+    """since and until from the query string, each '' unless it is a valid YYYY-MM-DD date."""
+    dates = []
+    for key in ('since', 'until'):
+        try:
+            dates.append(datetime.strptime(request.args.get(key, ''), '%Y-%m-%d').strftime('%Y-%m-%d'))
+        except ValueError:
+            dates.append('')
+    return dates
+
+
+@app.route("/wrestler/<path:name>")
+def wrestler(name):
+    roster = get_roster()
+    if name not in roster:
+        return render_template('404.html'), 404
+
+    since, until = timeline_range()
+    arms = []
+    for column, arm in enumerate(['right', 'left']):
+        timeline = rating_timeline(name, arm, since, until)
+        arms.append((arm, roster.ratings[name][column], roster.rank(name, arm), timeline, [row[1] for row in timeline]))
+    return render_template('wrestler.html', name=name, arms=arms, since=since, until=until)
+
+
+@app.route("/api/v1/wrestlers/<path:name>/timeline")
+def api_timeline(name):
+    if name not in get_roster():
+        return jsonify({'error': str(UnknownArmwrestlerError([name])), 'unknown': [name]}), 404
+
+    arm = 'left' if request.args.get('arm') == 'left' else 'right'
+    since, until = timeline_range()
+    timeline = [{'match_id': history_id, 'elo': elo, 'date': date} for history_id, elo, date in rating_timeline(name, arm, since, until)]
+    return jsonify({'name': name, 'arm': arm, 'timeline': timeline})
 
 
 @app.route("/remove_member", methods=["POST"])
@@ -139,7 +222,9 @@ def remove_member():
 
     name = request.form.get('name')
     try:
-        db_execute("DELETE FROM armwrestlers WHERE name = ?", name)
+        with transaction():
+            db_execute("DELETE FROM armwrestlers WHERE name = ?", name)
+            bump_data_version()
     except sqlite3.DatabaseError as error:
         print(error)
     return redirect(url_for('ranking'))
@@ -156,44 +241,45 @@ def confirm_remove():
 
 @app.route("/closest_matches")
 def closest_matches():
-    arm = request.args.get('arm', 'right')
+    arm = 'left' if request.args.get('arm') == 'left' else 'right'
     supermatch_add = False
 
-    order_by = 'right_elo' if arm == 'right' else 'left_elo'
     if session.get('username'):
         supermatch_add = True
 
-    query = """
-    WITH rankedarmwrestlers AS (
-        SELECT DENSE_RANK() OVER (ORDER BY {0} DESC) AS rank, 
-               name, 
-               {0} AS elo
-        FROM armwrestlers
-    )
-    SELECT 
-        a.rank AS rank1, 
-        a.name AS armwrestler1, 
-        a.elo AS elo1, 
-        b.rank AS rank2, 
-        b.name AS armwrestler2, 
-        b.elo AS elo2, 
-        ABS(a.elo - b.elo) AS elo_difference
-    FROM rankedarmwrestlers a, rankedarmwrestlers b
-    WHERE a.name < b.name
-    ORDER BY elo_difference ASC
-    LIMIT 15;
-    """.format(order_by)
-
-    closest_matches = db_execute(query)
+    try:
+        count = min(max(int(request.args.get('count', 15)), 1), 100)
+    except ValueError:
+        count = 15
+    try:
+        window = max(int(request.args['window']), 1) if 'window' in request.args else None
+    except ValueError:
+        window = None
+    try:
+        exclude_days = max(int(request.args.get('exclude_days', 0)), 0)
+    except ValueError:
+        exclude_days = 0
+
+    exclude = set()
+    if exclude_days:
+        recent = db_execute("SELECT armwrestler1_name, armwrestler2_name FROM history WHERE arm = ? AND date >= datetime('now', ?)", arm, f'-{exclude_days} days')
+        exclude = {frozenset(pair) for pair in recent}
+
+    closest_matches = closest_pairs(get_roster().by_elo(arm), count, window, exclude)
+    win_matrix = get_win_matrix(arm, 5)
     closest_matches_with_predictions = []
     for match in closest_matches:
-        binom_predicted_1, binom_predicted_2 = binom_prediction(match[2], match[5])
+        if win_matrix is not None:
+            binom_predicted_1, binom_predicted_2 = win_matrix.probability(match[1], match[4])
+        else:
+            binom_predicted_1, binom_predicted_2 = binom_prediction(match[2], match[5])
         binom_predicted_1, binom_predicted_2 = round(binom_predicted_1 * 100, 1), round(binom_predicted_2 * 100, 1)
         color_1, color_2 = (f"success", "danger") if binom_predicted_1 > binom_predicted_2 else ((f"danger", "success") if binom_predicted_1 < binom_predicted_2 else ("secondary", "secondary"))
         match_with_prediction = match + (binom_predicted_1, binom_predicted_2, color_1, color_2)
         closest_matches_with_predictions.append(match_with_prediction)
 
-    return render_template('closest_matches.html', closest_matches_with_predictions=closest_matches_with_predictions, arm=arm, supermatch_add=supermatch_add)
+    return render_template('closest_matches.html', closest_matches_with_predictions=closest_matches_with_predictions, arm=arm, supermatch_add=supermatch_add,
+                           count=count, exclude_days=exclude_days)
 
 
 @app.route("/add_new_member", methods=["GET", "POST"])
@@ -205,7 +291,8 @@ def add_new_member():
 
     name = request.form.get('name', '')
     arm = request.form.get('arm', 'right')
-    armwrestlers = db_execute('SELECT name FROM armwrestlers ORDER BY LOWER(name)')
+    roster = get_roster()
+    armwrestlers = roster.armwrestlers
     selected_armwrestler_2 = request.form.get('armwrestler2', 'none')
     supermatch_formats = list(SUPERMATCH_FORMATS.keys())
     value_for_score = None
@@ -218,13 +305,13 @@ def add_new_member():
     calculation_ready = False
     member_ready = False
     elo_from_match = None
+    previews = None
     error = None
 
     if not name and request.method == "POST":
         error = "No name entered"
 
-    armwrestler_names = [aw[0] for aw in armwrestlers]
-    if name in armwrestler_names:
+    if name in roster:
         error = "Name already taken"
 
     selected_format = request.form.get('supermatch_format', 'none')
@@ -235,7 +322,7 @@ def add_new_member():
 
     if arm in ['left', 'right'] and \
             name != selected_armwrestler_2 and \
-            selected_armwrestler_2 in armwrestler_names:
+            selected_armwrestler_2 in roster:
         calculation_ready = True
 
     try:
@@ -266,21 +353,23 @@ def add_new_member():
             armwrestler_1_score, armwrestler_2_score = match_result(max_rounds, value_for_score, SUPERMATCH_FORMATS[selected_format][2])
 
         armwrestler_2_elo = get_current_elo(arm, [selected_armwrestler_2])[0]
-        elo_from_match = expected_elo_from_score(armwrestler_2_elo, (armwrestler_1_score, armwrestler_2_score))
+        elo_from_match = estimated_elo(armwrestler_2_elo, (armwrestler_1_score, armwrestler_2_score))
+        if not custom_score:
+            previews = score_previews(selected_format, armwrestler_2_elo)
 
         add_to_avg_pressed = request.form.get('add_to_avg', False)
         if add_to_avg_pressed:
             if arm == 'right' and elo_from_match:
                 if refs_right == 0:
-                    right_elo += expected_elo_from_score(armwrestler_2_elo, (armwrestler_1_score, armwrestler_2_score))
+                    right_elo += elo_from_match
                 else:
-                    right_elo = ((right_elo * refs_right) + expected_elo_from_score(armwrestler_2_elo, (armwrestler_1_score, armwrestler_2_score))) / (refs_right + 1)
+                    right_elo = ((right_elo * refs_right) + elo_from_match) / (refs_right + 1)
                 refs_right += 1
             elif arm == 'left' and elo_from_match:
                 if refs_left == 0:
-                    left_elo += expected_elo_from_score(armwrestler_2_elo, (armwrestler_1_score, armwrestler_2_score))
+                    left_elo += elo_from_match
                 else:
-                    left_elo = ((left_elo * refs_left) + expected_elo_from_score(armwrestler_2_elo, (armwrestler_1_score, armwrestler_2_score))) / (refs_left + 1)
+                    left_elo = ((left_elo * refs_left) + elo_from_match) / (refs_left + 1)
                 refs_left += 1
 
             right_elo, left_elo = round(right_elo), round(left_elo)
@@ -292,7 +381,7 @@ def add_new_member():
             refs_right, refs_left = 0, 0
             calculation_ready = False
 
-    if name and name not in armwrestler_names and \
+    if name and name not in roster and \
             error == None and \
             right_elo > 0 and \
             left_elo > 0:
@@ -300,7 +389,9 @@ def add_new_member():
 
     if 'add_member' in request.form and member_ready:
         try:
-            db_execute("INSERT INTO armwrestlers (name, right_elo, left_elo, added_by) VALUES (?, ?, ?, ?)", name, right_elo, left_elo, current_user)
+            with transaction():
+                db_execute("INSERT INTO armwrestlers (name, right_elo, left_elo, added_by) VALUES (?, ?, ?, ?)", name, right_elo, left_elo, current_user)
+                bump_data_version()
         except sqlite3.DatabaseError as error:
             print(error)
         return redirect(url_for('ranking'))
@@ -319,6 +410,7 @@ def add_new_member():
         'elo_from_match': elo_from_match,
         'member_ready': member_ready,
         'custom_score': custom_score, 'custom_score_1': armwrestler_1_score, 'custom_score_2': armwrestler_2_score,
+        'previews': previews,
         'error': error
     }
 
@@ -330,13 +422,50 @@ def add_new_member():
 
 @app.route("/update_name", methods=["POST"])
 def update_name():
-    name = request.form.get('name')
+    name = request.form.get('name', '')
     return render_template('add_new_member_name_display.html', name=name)
 
 
+HISTORY_PAGE_SIZE = 20
+
+
 @app.route("/history")
 def history():
-    history = db_execute('SELECT * FROM history ORDER BY id DESC LIMIT 20')
+    name = request.args.get('name', '')
+    arm = request.args.get('arm', '')
+    selected_format = request.args.get('supermatch_format', '')
+    try:
+        before = int(request.args['before']) if 'before' in request.args else None
+    except ValueError:
+        before = None
+
+    # Keyset pagination on id, so every page is an index range scan no matter how deep
+    conditions, args = [], []
+    if before is not None:
+        conditions.append('id < ?')
+        args.append(before)
+    if arm in ['left', 'right']:
+        conditions.append('arm = ?')
+        args.append(arm)
+    if selected_format in SUPERMATCH_FORMATS:
+        conditions.append('selected_format = ?')
+        args.append(selected_format)
+
+    limit = HISTORY_PAGE_SIZE + 1
+    if name:
+        # One ordered scan per side of the match instead of an OR that has to be sorted
+        where = ' AND '.join(conditions + ['{} = ?'])
+        side = f'SELECT * FROM (SELECT * FROM history WHERE {where} ORDER BY id DESC LIMIT ?)'
+        query = f"{side.format('armwrestler1_name')} UNION ALL {side.format('armwrestler2_name')} ORDER BY id DESC LIMIT ?"
+        history = db_execute(query, *args, name, limit, *args, name, limit, limit)
+    else:
+        where = 'WHERE ' + ' AND '.join(conditions) if conditions else ''
+        history = db_execute(f'SELECT * FROM history {where} ORDER BY id DESC LIMIT ?', *args, limit)
+    next_before = None
+    if len(history) > HISTORY_PAGE_SIZE:
+        history = history[:HISTORY_PAGE_SIZE]
+        next_before = history[-1][0]
+
     colors = []
     for record in history:
         armwrestler_1_diff_format, armwrestler_2_diff_format = record[10], record[11]
@@ -351,7 +480,15 @@ def history():
 
         colors.append((armwrestler_1_score_color, armwrestler_2_score_color, armwrestler_1_diff_color, armwrestler_2_diff_color, armwrestler_1_diff_format, armwrestler_2_diff_format))
 
-    return render_template('history.html', history=history, colors=colors)
+    template_data = {
+        'history': history, 'colors': colors, 'next_before': next_before,
+        'name': name, 'arm': arm, 'selected_format': selected_format
+    }
+
+    if request.headers.get('HX-Request'):
+        return render_template('history_partial.html', **template_data)
+    else:
+        return render_template('history.html', armwrestlers=get_roster().armwrestlers, supermatch_formats=list(SUPERMATCH_FORMATS.keys()), **template_data)
 
 
 @app.route("/undo_last_match", methods=["POST"])
@@ -360,17 +497,59 @@ def undo_last_match():
         return redirect(url_for('login'))
 
     try:
-        armwrestler1_name, armwrestler2_name, arm, armwrestler1_elo, armwrestler2_elo = db_execute(
-            'SELECT armwrestler1_name, armwrestler2_name, arm, armwrestler1_elo, armwrestler2_elo FROM history ORDER BY id DESC LIMIT 1')[0]
-        dbarm = 'right_elo' if arm == 'right' else 'left_elo'
-        db_execute("UPDATE armwrestlers SET {} = ? WHERE name = ?".format(dbarm), armwrestler1_elo, armwrestler1_name)
-        db_execute("UPDATE armwrestlers SET {} = ? WHERE name = ?".format(dbarm), armwrestler2_elo, armwrestler2_name)
-        db_execute('DELETE FROM history WHERE id = (SELECT MAX(id) FROM history)')
-    except (sqlite3.DatabaseError, IndexError) as error:
+        write_transaction(revert_last_match)
+    except (sqlite3.DatabaseError, IndexError, CalibratedHistoryError) as error:
         print(error)
     return redirect(url_for('history'))
 
 
+def revert_last_match():
+    match_id = db_execute('SELECT MAX(id) FROM history')[0][0]
+    if match_id is None:
+        raise IndexError('No matches to undo')
+    undo_match(match_id, K_BY_FORMAT)
+
+
+@app.route("/edit_match/<int:match_id>", methods=["GET", "POST"])
+def edit_match(match_id):
+    if not session.get('username'):
+        return redirect(url_for('login'))
+
+    record = db_execute('SELECT * FROM history WHERE id = ?', match_id)
+    if not record:
+        return render_template('404.html'), 404
+    record = record[0]
+
+    supermatch_formats = list(SUPERMATCH_FORMATS.keys())
+    selected_format = request.form.get('supermatch_format', record[12])
+    if selected_format not in supermatch_formats:
+        selected_format = record[12]
+    max_rounds = SUPERMATCH_FORMATS[selected_format][0]
+    error = None
+
+    if request.method == "POST":
+        try:
+            if 'undo_match' in request.form:
+                write_transaction(undo_match, match_id, K_BY_FORMAT)
+                return redirect(url_for('history'))
+
+            armwrestler_1_score = int(request.form.get('score_1', ''))
+            armwrestler_2_score = int(request.form.get('score_2', ''))
+            if not (0 <= armwrestler_1_score <= max_rounds and 0 <= armwrestler_2_score <= max_rounds and (0 < (armwrestler_1_score + armwrestler_2_score) <= max_rounds)):
+                raise ValueError
+            write_transaction(rescore_match, match_id, armwrestler_1_score, armwrestler_2_score, selected_format, K_BY_FORMAT)
+            return redirect(url_for('history'))
+        except CalibratedHistoryError as calibrated_error:
+            error = str(calibrated_error)
+        except (ValueError, TypeError):
+            error = "Invalid score for this format"
+        except (sqlite3.DatabaseError, IndexError) as db_error:
+            print(db_error)
+            error = "Could not update the match"
+
+    return render_template('edit_match.html', record=record, supermatch_formats=supermatch_formats, selected_format=selected_format, max_rounds=max_rounds, error=error)
+
+
 @app.route("/supermatch", methods=["GET", "POST"])
 def supermatch():
     if not session.get('username'):
@@ -389,7 +568,9 @@ def supermatch():
     armwrestler_1_color, armwrestler_2_color = None, None
     custom_score = request.form.get('custom_score', False)
     armwrestler_1_elo, armwrestler_2_elo = None, None
-    armwrestlers = db_execute('SELECT name FROM armwrestlers ORDER BY LOWER(name)')
+    previews = None
+    roster = get_roster()
+    armwrestlers = roster.armwrestlers
 
     selected_format = request.form.get('supermatch_format', 'none')
     if selected_format not in supermatch_formats:
@@ -402,11 +583,10 @@ def supermatch():
     armwrestlers_2 = [aw for aw in armwrestlers if aw[0] != selected_armwrestler_1] if selected_armwrestler_1 != 'none' else None
 
     # Checks if all conditions are met for supermatch ready
-    armwrestler_names = [aw[0] for aw in armwrestlers]
     if arm in ['left', 'right'] and \
             selected_armwrestler_1 != selected_armwrestler_2 and \
-            selected_armwrestler_1 in armwrestler_names and \
-            selected_armwrestler_2 in armwrestler_names and \
+            selected_armwrestler_1 in roster and \
+            selected_armwrestler_2 in roster and \
             selected_format in supermatch_formats:
         if custom_score:
             try:
@@ -425,16 +605,16 @@ def supermatch():
             armwrestler_1_score, armwrestler_2_score = match_result(max_rounds, value_for_score, SUPERMATCH_FORMATS[selected_format][2])
 
         armwrestler_1_elo, armwrestler_2_elo = get_current_elo(arm, [selected_armwrestler_1, selected_armwrestler_2])
-        armwrestler_1_diff, armwrestler_2_diff = diff_supermatch(armwrestler_1_elo, armwrestler_2_elo, (armwrestler_1_score, armwrestler_2_score), SUPERMATCH_FORMATS[selected_format][1])
-        armwrestler_1_diff, armwrestler_1_color = (f"+{armwrestler_1_diff}", "text-success") if armwrestler_1_diff > 0 else ((str(armwrestler_1_diff),
-                                                                                                                              "text-danger") if armwrestler_1_diff < 0 else ("0", "text-secondary"))
-        armwrestler_2_diff, armwrestler_2_color = (f"+{armwrestler_2_diff}", "text-success") if armwrestler_2_diff > 0 else ((str(armwrestler_2_diff),
-                                                                                                                              "text-danger") if armwrestler_2_diff < 0 else ("0", "text-secondary"))
+        armwrestler_1_diff, armwrestler_2_diff = supermatch_diffs(armwrestler_1_elo, armwrestler_2_elo, (armwrestler_1_score, armwrestler_2_score), selected_format)
+        armwrestler_1_diff, armwrestler_1_color = format_diff(armwrestler_1_diff)
+        armwrestler_2_diff, armwrestler_2_color = format_diff(armwrestler_2_diff)
+        if not custom_score:
+            previews = score_previews(selected_format, armwrestler_1_elo, armwrestler_2_elo)
         supermatch_ready = True
 
     submit_pressed = 'submit_match' in request.form
     if submit_pressed and supermatch_ready:
-        submit_supermatch(arm, selected_armwrestler_1, selected_armwrestler_2, armwrestler_1_score, armwrestler_2_score, armwrestler_1_elo, armwrestler_2_elo, selected_format, current_user)
+        submit_supermatch(arm, selected_armwrestler_1, selected_armwrestler_2, armwrestler_1_score, armwrestler_2_score, selected_format, current_user)
         return redirect(url_for('ranking'))
 
     template_data = {
@@ -447,7 +627,8 @@ def supermatch():
         'armwrestler_1_diff': armwrestler_1_diff, 'armwrestler_2_diff': armwrestler_2_diff,
         'armwrestler_1_color': armwrestler_1_color, 'armwrestler_2_color': armwrestler_2_color,
         'armwrestler_1_elo': armwrestler_1_elo, 'armwrestler_2_elo': armwrestler_2_elo,
-        'custom_score': custom_score, 'custom_score_1': armwrestler_1_score, 'custom_score_2': armwrestler_2_score
+        'custom_score': custom_score, 'custom_score_1': armwrestler_1_score, 'custom_score_2': armwrestler_2_score,
+        'previews': previews
     }
 
     if request.headers.get('HX-Request'):
@@ -456,44 +637,82 @@ def supermatch():
         return render_template('supermatch.html', **template_data)
 
 
-def submit_supermatch(arm, armwrestler_1, armwrestler_2, armwrestler_1_score, armwrestler_2_score, armwrestler_1_elo, armwrestler_2_elo, selected_format, current_user):
+def submit_supermatch(arm, armwrestler_1, armwrestler_2, armwrestler_1_score, armwrestler_2_score, selected_format, current_user):
+    try:
+        version, changes = write_transaction(record_supermatch, arm, armwrestler_1, armwrestler_2, armwrestler_1_score, armwrestler_2_score, selected_format, current_user)
+        update_roster(version, version + 1, changes)
+    except (sqlite3.DatabaseError, UnknownArmwrestlerError) as error:
+        print(error)
+
 
+def record_supermatch(arm, armwrestler_1, armwrestler_2, armwrestler_1_score, armwrestler_2_score, selected_format, current_user):
+    # Runs inside the write transaction, so the ratings read here cannot change before the commit
     dbarm = 'right_elo' if arm == 'right' else 'left_elo'
+    armwrestler_1_elo, armwrestler_2_elo = fetch_ratings([armwrestler_1, armwrestler_2], arm)
     updated_1, updated_2 = calculate_elo_with_bonus(armwrestler_1_elo, armwrestler_2_elo, (armwrestler_1_score, armwrestler_2_score), SUPERMATCH_FORMATS[selected_format][1])
+    armwrestler_1_diff, armwrestler_2_diff = updated_1 - armwrestler_1_elo, updated_2 - armwrestler_2_elo
+
+    roster = get_roster(fresh=True)
+    armwrestler_1_rank, armwrestler_2_rank = roster.rank(armwrestler_1, arm), roster.rank(armwrestler_2, arm)
+
+    query = '''
+    INSERT INTO history ( 
+    armwrestler1_name, armwrestler2_name, 
+    arm, 
+    selected_format,
+    armwrestler1_rank, armwrestler2_rank, 
+    armwrestler1_elo, armwrestler2_elo, 
+    armwrestler1_score, armwrestler2_score, 
+    armwrestler1_elo_diff, armwrestler2_elo_diff,
+    added_by ) 
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    '''
+    db_execute(query,
+               armwrestler_1, armwrestler_2,
+               arm,
+               selected_format,
+               armwrestler_1_rank, armwrestler_2_rank,
+               armwrestler_1_elo, armwrestler_2_elo,
+               armwrestler_1_score, armwrestler_2_score,
+               armwrestler_1_diff, armwrestler_2_diff,
+               current_user)
+    record_timeline(arm, db_execute("SELECT last_insert_rowid()")[0][0])
+
+    db_execute("UPDATE armwrestlers SET {} = ? WHERE name = ?".format(dbarm), updated_1, armwrestler_1)
+    db_execute("UPDATE armwrestlers SET {} = ? WHERE name = ?".format(dbarm), updated_2, armwrestler_2)
+    bump_data_version()
+    snapshot_if_due(arm)
+
+    right_1, left_1 = roster.ratings[armwrestler_1]
+    right_2, left_2 = roster.ratings[armwrestler_2]
+    if arm == 'right':
+        changes = {armwrestler_1: (updated_1, left_1), armwrestler_2: (updated_2, left_2)}
+    else:
+        changes = {armwrestler_1: (right_1, updated_1), armwrestler_2: (right_2, updated_2)}
+    return roster.version, changes
 
-    armwrestler_1_rank = db_execute('SELECT rank FROM (SELECT RANK() OVER (ORDER BY {} DESC) AS rank, name FROM armwrestlers) AS RankedArmwrestlers WHERE name = ?'.format(dbarm), armwrestler_1)[0][0]
-    armwrestler_2_rank = db_execute('SELECT rank FROM (SELECT RANK() OVER (ORDER BY {} DESC) AS rank, name FROM armwrestlers) AS RankedArmwrestlers WHERE name = ?'.format(dbarm), armwrestler_2)[0][0]
 
-    armwrestler_1_diff, armwrestler_2_diff = diff_supermatch(armwrestler_1_elo, armwrestler_2_elo, (armwrestler_1_score, armwrestler_2_score), SUPERMATCH_FORMATS[selected_format][1])
+@app.route("/import_results", methods=["GET", "POST"])
+def import_results_upload():
+    if not session.get('username'):
+        return redirect(url_for('login'))
 
-    try:
-        query = '''
-        INSERT INTO history ( 
-        armwrestler1_name, armwrestler2_name, 
-        arm, 
-        selected_format,
-        armwrestler1_rank, armwrestler2_rank, 
-        armwrestler1_elo, armwrestler2_elo, 
-        armwrestler1_score, armwrestler2_score, 
-        armwrestler1_elo_diff, armwrestler2_elo_diff,
-        added_by ) 
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        '''
-        db_execute(query,
-                   armwrestler_1, armwrestler_2,
-                   arm,
-                   selected_format,
-                   armwrestler_1_rank, armwrestler_2_rank,
-                   armwrestler_1_elo, armwrestler_2_elo,
-                   armwrestler_1_score, armwrestler_2_score,
-                   armwrestler_1_diff, armwrestler_2_diff,
-                   current_user)
-
-        db_execute("UPDATE armwrestlers SET {} = ? WHERE name = ?".format(dbarm), updated_1, armwrestler_1)
-        db_execute("UPDATE armwrestlers SET {} = ? WHERE name = ?".format(dbarm), updated_2, armwrestler_2)
+    error, errors, imported = None, [], None
+    if request.method == "POST":
+        upload = request.files.get('results')
+        if not upload or not upload.filename:
+            error = "No file selected"
+        else:
+            try:
+                lines = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+                imported = write_transaction(import_results, lines, session.get('username'), SUPERMATCH_FORMATS)
+            except ResultsImportError as import_error:
+                errors = import_error.errors
+            except (sqlite3.DatabaseError, UnicodeDecodeError) as import_error:
+                print(import_error)
+                error = "Could not import the file"
 
-    except sqlite3.DatabaseError as error:
-        print(error)
+    return render_template('import_results.html', error=error, errors=errors, imported=imported)
 
 
 @app.route("/prediction")
@@ -503,17 +722,18 @@ def prediction():
     selected_armwrestler_1 = request.args.get('armwrestler1', 'none')
     selected_armwrestler_2 = request.args.get('armwrestler2', 'none')
     supermatch_formats = list(SUPERMATCH_FORMATS.keys())
-    armwrestlers = db_execute('SELECT name FROM armwrestlers ORDER BY LOWER(name)')
+    roster = get_roster()
+    armwrestlers = roster.armwrestlers
     prediction_ready = False
     armwrestler_1_elo, armwrestler_2_elo = None, None
     expected_1, expected_2 = None, None
     binom_predicted_1, binom_predicted_2, binom_draw = None, None, None
     win_chance_color, score_color = None, None
+    scorelines = None
 
     if selected_armwrestler_1 == selected_armwrestler_2:
         selected_armwrestler_2 = 'none'
     armwrestlers_2 = [aw for aw in armwrestlers if aw[0] != selected_armwrestler_1] if selected_armwrestler_1 != 'none' else None
-    armwrestler_names = [aw[0] for aw in armwrestlers]
 
     selected_format = request.args.get('supermatch_format', 'none')
     if selected_format not in supermatch_formats:
@@ -523,8 +743,8 @@ def prediction():
 
     if arm in ['left', 'right'] and \
             selected_armwrestler_1 != selected_armwrestler_2 and \
-            selected_armwrestler_1 in armwrestler_names and \
-            selected_armwrestler_2 in armwrestler_names and \
+            selected_armwrestler_1 in roster and \
+            selected_armwrestler_2 in roster and \
             selected_format in supermatch_formats:
         armwrestler_1_elo, armwrestler_2_elo = get_current_elo(arm, [selected_armwrestler_1, selected_armwrestler_2])
         expected_1, expected_2 = expected_score_rounds(armwrestler_1_elo, armwrestler_2_elo, SUPERMATCH_FORMATS[selected_format][2], max_rounds)
@@ -535,6 +755,8 @@ def prediction():
         score_color = win_chance_color
         if expected_1 == expected_2:
             score_color = (f"secondary", "secondary")
+        scorelines = [(scoreline, round(probability * 100, 1)) for scoreline, probability in
+                      scoreline_prediction(armwrestler_1_elo, armwrestler_2_elo, max_rounds, SUPERMATCH_FORMATS[selected_format][2])]
         prediction_ready = True
 
     template_data = {
@@ -546,7 +768,8 @@ def prediction():
         'armwrestler_1_elo': armwrestler_1_elo, 'armwrestler_2_elo': armwrestler_2_elo,
         'expected_1': expected_1, 'expected_2': expected_2,
         'binom_predicted_1': binom_predicted_1, 'binom_predicted_2': binom_predicted_2, 'binom_draw': binom_draw,
-        'win_chance_color': win_chance_color, 'score_color': score_color
+        'win_chance_color': win_chance_color, 'score_color': score_color,
+        'scorelines': scorelines
     }
 
     if request.headers.get('HX-Request'):
@@ -564,7 +787,8 @@ def elo_from_match():
     selected_armwrestler_2 = request.args.get('armwrestler2', 'none')
     supermatch_formats = list(SUPERMATCH_FORMATS.keys())
     value_for_score = None
-    armwrestlers = db_execute('SELECT name FROM armwrestlers ORDER BY LOWER(name)')
+    roster = get_roster()
+    armwrestlers = roster.armwrestlers
     armwrestlers_2 = None
     armwrestler_1_score, armwrestler_2_score = None, None
     armwrestler_1_diff, armwrestler_2_diff = None, None
@@ -573,12 +797,12 @@ def elo_from_match():
     custom_score = request.args.get('custom_score', False)
     calculation_ready = False
     elo_from_match = None
+    previews = None
 
     if ranked == 'ranked':
         if selected_armwrestler_1 == selected_armwrestler_2:
             selected_armwrestler_2 = 'none'
         armwrestlers_2 = [aw for aw in armwrestlers if aw[0] != selected_armwrestler_1] if selected_armwrestler_1 != 'none' else None
-    armwrestler_names = [aw[0] for aw in armwrestlers]
 
     selected_format = request.args.get('supermatch_format', 'none')
     if selected_format not in supermatch_formats:
@@ -589,14 +813,14 @@ def elo_from_match():
     if arm in ['left', 'right'] and \
             ranked == 'ranked' and \
             selected_armwrestler_1 != selected_armwrestler_2 and \
-            selected_armwrestler_1 in armwrestler_names and \
-            selected_armwrestler_2 in armwrestler_names and \
+            selected_armwrestler_1 in roster and \
+            selected_armwrestler_2 in roster and \
             selected_format in supermatch_formats:
         calculation_ready = True
 
     elif arm in ['left', 'right'] and \
             ranked == 'unranked' and \
-            selected_armwrestler_1 in armwrestler_names and \
+            selected_armwrestler_1 in roster and \
             selected_format in supermatch_formats:
         calculation_ready = True
 
@@ -619,15 +843,17 @@ def elo_from_match():
 
         if ranked == 'ranked':
             armwrestler_1_elo, armwrestler_2_elo = get_current_elo(arm, [selected_armwrestler_1, selected_armwrestler_2])
-            armwrestler_1_diff, armwrestler_2_diff = diff_supermatch(armwrestler_1_elo, armwrestler_2_elo, (armwrestler_1_score, armwrestler_2_score), SUPERMATCH_FORMATS[selected_format][1])
-            armwrestler_1_diff, armwrestler_1_color = (f"+{armwrestler_1_diff}", "text-success") if armwrestler_1_diff > 0 else ((str(armwrestler_1_diff),
-                                                                                                                                  "text-danger") if armwrestler_1_diff < 0 else ("0", "text-secondary"))
-            armwrestler_2_diff, armwrestler_2_color = (f"+{armwrestler_2_diff}", "text-success") if armwrestler_2_diff > 0 else ((str(armwrestler_2_diff),
-                                                                                                                                  "text-danger") if armwrestler_2_diff < 0 else ("0", "text-secondary"))
+            armwrestler_1_diff, armwrestler_2_diff = supermatch_diffs(armwrestler_1_elo, armwrestler_2_elo, (armwrestler_1_score, armwrestler_2_score), selected_format)
+            armwrestler_1_diff, armwrestler_1_color = format_diff(armwrestler_1_diff)
+            armwrestler_2_diff, armwrestler_2_color = format_diff(armwrestler_2_diff)
+            if not custom_score:
+                previews = score_previews(selected_format, armwrestler_1_elo, armwrestler_2_elo)
 
         elif ranked == 'unranked':
             armwrestler_1_elo = get_current_elo(arm, [selected_armwrestler_1])[0]
-            elo_from_match = expected_elo_from_score(armwrestler_1_elo, (armwrestler_1_score, armwrestler_2_score))
+            elo_from_match = estimated_elo(armwrestler_1_elo, (armwrestler_1_score, armwrestler_2_score))
+            if not custom_score:
+                previews = score_previews(selected_format, armwrestler_1_elo)
 
     template_data = {
         'ranked': ranked, 'arm': arm,
@@ -640,7 +866,8 @@ def elo_from_match():
         'armwrestler_1_color': armwrestler_1_color, 'armwrestler_2_color': armwrestler_2_color,
         'armwrestler_1_elo': armwrestler_1_elo, 'armwrestler_2_elo': armwrestler_2_elo,
         'calculation_ready': calculation_ready, 'elo_from_match': elo_from_match,
-        'custom_score': custom_score, 'custom_score_1': armwrestler_1_score, 'custom_score_2': armwrestler_2_score
+        'custom_score': custom_score, 'custom_score_1': armwrestler_1_score, 'custom_score_2': armwrestler_2_score,
+        'previews': previews
     }
 
     if request.headers.get('HX-Request'):
@@ -650,17 +877,57 @@ def elo_from_match():
 
 
 def get_current_elo(arm, armwrestlers):
-    dbarm = 'right_elo' if arm == 'right' else 'left_elo'
-    elos = []
+    return get_ratings(armwrestlers, arm)
+
+
+# Bound on each memoized calculation below; they are shared by all requests of the process
+PREVIEW_CACHE_SIZE = 4096
+
+
+def format_diff(diff):
+    if diff > 0:
+        return f"+{diff}", "text-success"
+    if diff < 0:
+        return str(diff), "text-danger"
+    return "0", "text-secondary"
+
+
+@lru_cache(maxsize=PREVIEW_CACHE_SIZE)
+def supermatch_diffs(armwrestler_1_elo, armwrestler_2_elo, scores, selected_format):
+    return diff_supermatch(armwrestler_1_elo, armwrestler_2_elo, scores, SUPERMATCH_FORMATS[selected_format][1])
 
-    for armwrestler in armwrestlers:
-        result = db_execute('SELECT {} FROM armwrestlers WHERE name = ?'.format(dbarm), armwrestler)
-        elo = result[0][0]
-        elos.append(elo)
 
-    return elos
+@lru_cache(maxsize=PREVIEW_CACHE_SIZE)
+def estimated_elo(armwrestler_elo, scores):
+    return expected_elo_from_score(armwrestler_elo, scores)
 
 
+@lru_cache(maxsize=PREVIEW_CACHE_SIZE)
+def score_previews(selected_format, armwrestler_1_elo, armwrestler_2_elo=None):
+    """What the result panel shows at every position of the score slider, so the page can move it without a request.
+
+    Each preview maps a data-preview key of the template to (text, class),
+    class None keeping the element's own. Without armwrestler_2_elo the
+    previews are the estimated elo of an unranked armwrestler against
+    armwrestler_1_elo.
+    """
+    max_rounds, _, format_type = SUPERMATCH_FORMATS[selected_format]
+    previews = []
+    for value in range(max_rounds + 1):
+        scores = match_result(max_rounds, value, format_type)
+        preview = {'score_1': (scores[0], None), 'score_2': (scores[1], None)}
+        if armwrestler_2_elo is None:
+            preview['estimate'] = (estimated_elo(armwrestler_1_elo, scores), None)
+        else:
+            diffs = supermatch_diffs(armwrestler_1_elo, armwrestler_2_elo, scores, selected_format)
+            for side, elo, diff in ((1, armwrestler_1_elo, diffs[0]), (2, armwrestler_2_elo, diffs[1])):
+                text, color = format_diff(diff)
+                preview[f'diff_{side}'] = (f"{elo} {text}", color)
+        previews.append(preview)
+    return previews
+
+
+@lru_cache(maxsize=PREVIEW_CACHE_SIZE)
 def match_result(max_rounds, value, format_type):
     if value < 0:
         value = 0
@@ -747,6 +1014,155 @@ def expected_score_rounds(armwrestler_a_elo, armwrestler_b_elo, format_type, max
     return armwrestler1_score, armwrestler2_score
 
 
+def expected_score_rounds_batch(armwrestler_a_elos, armwrestler_b_elos, format_types, max_rounds):
+    """expected_score_rounds for many pairs at once; format_types and max_rounds are per pair."""
+    expected_a, expected_b = expected_score_batch(armwrestler_a_elos, armwrestler_b_elos)
+    format_types, max_rounds = np.asarray(format_types), np.asarray(max_rounds)
+    a_ahead, b_ahead = expected_a > expected_b, expected_a < expected_b
+
+    # All rounds
+    scores_a, scores_b = np.rint(expected_a * max_rounds), np.rint(expected_b * max_rounds)
+
+    # Best of: the favourite gets the wins required, the other one a proportional score
+    best_of = format_types == "Best of"
+    wins_required = max_rounds // 2 + 1
+    best_of_a = np.where(a_ahead, wins_required, np.rint(expected_a * wins_required / np.where(b_ahead, expected_b, 1)))
+    best_of_b = np.where(a_ahead, np.rint(expected_b * wins_required / np.where(a_ahead, expected_a, 1)), wins_required)
+    tied = best_of_a == best_of_b
+    best_of_a, best_of_b = best_of_a - (tied & b_ahead), best_of_b - (tied & a_ahead)
+    scores_a, scores_b = np.where(best_of, best_of_a, scores_a), np.where(best_of, best_of_b, scores_b)
+
+    # Vendetta: rounded over the regular rounds, a tie goes to the favourite
+    vendetta = format_types == "Vendetta"
+    vendetta_a, vendetta_b = np.rint(expected_a * (max_rounds - 1)), np.rint(expected_b * (max_rounds - 1))
+    tied = vendetta_a == vendetta_b
+    vendetta_a, vendetta_b = vendetta_a + (tied & a_ahead), vendetta_b + (tied & b_ahead)
+    scores_a, scores_b = np.where(vendetta, vendetta_a, scores_a), np.where(vendetta, vendetta_b, scores_b)
+
+    equal = expected_a == expected_b
+    scores_a = ["Equal" if is_equal else int(score) for is_equal, score in zip(equal, scores_a)]
+    scores_b = ["Equal" if is_equal else int(score) for is_equal, score in zip(equal, scores_b)]
+    return scores_a, scores_b
+
+
+@app.route("/api/v1/rankings/<any(right, left):arm>")
+def api_rankings(arm):
+    version, updated_at = get_data_version()
+    rankings = [{'rank': rank, 'name': name, 'elo': elo} for rank, name, elo in get_roster().ranking(arm)]
+    return jsonify({'arm': arm, 'version': version, 'updated_at': updated_at, 'rankings': rankings})
+
+
+@app.route("/api/v1/ratings")
+def api_ratings():
+    roster = get_roster()
+    names = request.args.getlist('name') or [aw[0] for aw in roster.armwrestlers]
+    try:
+        ratings = get_ratings(names)
+    except UnknownArmwrestlerError as error:
+        return jsonify({'error': str(error), 'unknown': error.names}), 404
+    return jsonify({'version': roster.version, 'ratings': [{'name': name, 'right_elo': right_elo, 'left_elo': left_elo} for name, (right_elo, left_elo) in zip(names, ratings)]})
+
+
+API_MAX_PAIRS = 10000
+
+
+@app.route("/api/v1/predictions", methods=["POST"])
+def api_predictions():
+    """Predict many matches in one request.
+
+    Expects {"pairs": [{"armwrestler1": ..., "armwrestler2": ..., "arm": "right", "format": "Best of 5"}, ...]};
+    arm and format default to "right" and "Best of 5". Each prediction also lists the
+    chance of every final score under the rules of the format.
+    """
+    body = request.get_json(silent=True) or {}
+    pairs = body.get('pairs')
+    if not isinstance(pairs, list) or not 0 < len(pairs) <= API_MAX_PAIRS:
+        return jsonify({'error': f'Expected "pairs" with 1 to {API_MAX_PAIRS} entries'}), 400
+
+    errors = []
+    for index, pair in enumerate(pairs):
+        if (not isinstance(pair, dict) or not isinstance(pair.get('armwrestler1'), str) or not isinstance(pair.get('armwrestler2'), str)
+                or pair.get('arm', 'right') not in ['right', 'left'] or pair.get('format', 'Best of 5') not in SUPERMATCH_FORMATS):
+            errors.append(f'pairs[{index}]: needs armwrestler1, armwrestler2, arm (right or left) and a known format')
+    if errors:
+        return jsonify({'error': 'Invalid pairs', 'details': errors}), 400
+
+    arms = [pair.get('arm', 'right') for pair in pairs]
+    formats = [pair.get('format', 'Best of 5') for pair in pairs]
+    try:
+        ratings = get_ratings([pair['armwrestler1'] for pair in pairs] + [pair['armwrestler2'] for pair in pairs])
+    except UnknownArmwrestlerError as error:
+        return jsonify({'error': str(error), 'unknown': error.names}), 404
+    ratings_1, ratings_2 = ratings[:len(pairs)], ratings[len(pairs):]
+
+    columns = [0 if arm == 'right' else 1 for arm in arms]
+    elos_1 = np.array([elos[column] for elos, column in zip(ratings_1, columns)])
+    elos_2 = np.array([elos[column] for elos, column in zip(ratings_2, columns)])
+    max_rounds = np.array([SUPERMATCH_FORMATS[supermatch_format][0] for supermatch_format in formats])
+    format_types = [SUPERMATCH_FORMATS[supermatch_format][2] for supermatch_format in formats]
+
+    expected_1, expected_2 = expected_score_rounds_batch(elos_1, elos_2, format_types, max_rounds)
+    predicted_1, predicted_2 = binom_prediction_batch(elos_1, elos_2, max_rounds)
+    draws = 1 - (predicted_1 + predicted_2)
+
+    scorelines = [None] * len(pairs)
+    for supermatch_format in set(formats):
+        selected = [index for index, pair_format in enumerate(formats) if pair_format == supermatch_format]
+        format_rounds, _, format_type = SUPERMATCH_FORMATS[supermatch_format]
+        format_scorelines, probabilities = scoreline_prediction_batch(elos_1[selected], elos_2[selected], format_rounds, format_type)
+        for column, index in enumerate(selected):
+            scorelines[index] = [{'score': list(scoreline), 'probability': round(float(probability), 6)}
+                                 for scoreline, probability in zip(format_scorelines, probabilities[:, column])]
+
+    predictions = []
+    for index, pair in enumerate(pairs):
+        predictions.append({
+            'armwrestler1': pair['armwrestler1'], 'armwrestler2': pair['armwrestler2'],
+            'arm': arms[index], 'format': formats[index],
+            'elo1': int(elos_1[index]), 'elo2': int(elos_2[index]),
+            'expected_score': [expected_1[index], expected_2[index]],
+            'win_probability': [float(predicted_1[index]), float(predicted_2[index])],
+            'draw_probability': float(draws[index]),
+            'scorelines': scorelines[index],
+        })
+    return jsonify({'predictions': predictions})
+
+
+@app.route("/api/v1/win_matrix/<any(right, left):arm>")
+def api_win_matrix(arm):
+    """Win probabilities between all armwrestlers (or the ones given with name=) for one arm and format."""
+    supermatch_format = request.args.get('format', 'Best of 5')
+    if supermatch_format not in SUPERMATCH_FORMATS:
+        return jsonify({'error': f'Unknown format "{supermatch_format}"'}), 400
+
+    rounds = SUPERMATCH_FORMATS[supermatch_format][0]
+    roster = get_roster()
+    requested = request.args.getlist('name')
+    # The body depends on the format name and the requested names (in their order), not just on the rounds
+    etag = f'{arm}-{rounds}-{roster.version}-' + hashlib.sha1('\n'.join([supermatch_format] + requested).encode()).hexdigest()[:12]
+    if request.if_none_match.contains(etag):
+        return app.response_class(status=304, headers={'ETag': f'"{etag}"', 'Cache-Control': 'no-cache'})
+
+    win_matrix = get_win_matrix(arm, rounds)
+    names = requested or [name for (name,) in roster.armwrestlers]
+    if win_matrix is None and len(names) > MAX_MATRIX_SIZE:
+        return jsonify({'error': f'Choose at most {MAX_MATRIX_SIZE} armwrestlers with name='}), 400
+    try:
+        elos = get_ratings(names, arm)
+    except UnknownArmwrestlerError as error:
+        return jsonify({'error': str(error), 'unknown': error.names}), 404
+
+    if win_matrix is not None:
+        probabilities = win_matrix.submatrix(names)
+    else:
+        probabilities = binom_prediction_outer(elos, elos, rounds)
+    probabilities = probabilities.astype(float).round(6).tolist()
+    response = jsonify({'arm': arm, 'format': supermatch_format, 'version': roster.version, 'names': names, 'probabilities': probabilities})
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response
+
+
 @app.errorhandler(404)
 def page_not_found(e):
     app.logger.error(f"404 Error: {e}, path: {request.path}")
@@ -0,0 +1,95 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from elo import K, add_bonus_batch, calculate_elo_batch, expected_score_batch
+
+# Predictions are clipped this far from 0 and 1 before taking the log
+LOG_LOSS_EPSILON = 1e-12
+
+
+def prepare_matches(rows, k_by_format):
+    """Turn history rows into arrays for replaying.
+
+    rows are (armwrestler1_name, armwrestler2_name, armwrestler1_elo,
+    armwrestler2_elo, armwrestler1_score, armwrestler2_score, selected_format)
+    in the order the matches were played. Armwrestlers are numbered in order of
+    appearance and start from the elo they had in their first match. Each
+    match keeps its format K relative to elo.K, so a swept K scales every
+    format alike. Returns (players_1, players_2, scores_1, scores_2, k_factors, initial).
+    """
+    index, initial = {}, []
+    players_1, players_2, scores_1, scores_2, k_factors = [], [], [], [], []
+    for name_1, name_2, elo_1, elo_2, score_1, score_2, selected_format in rows:
+        if score_1 + score_2 <= 0:
+            continue
+        for name, elo in ((name_1, elo_1), (name_2, elo_2)):
+            if name not in index:
+                index[name] = len(initial)
+                initial.append(elo)
+        players_1.append(index[name_1])
+        players_2.append(index[name_2])
+        scores_1.append(score_1)
+        scores_2.append(score_2)
+        k_factors.append(k_by_format.get(selected_format, K) / K)
+
+    return (np.array(players_1, dtype=np.int64), np.array(players_2, dtype=np.int64), np.array(scores_1, dtype=float),
+            np.array(scores_2, dtype=float), np.array(k_factors), np.array(initial, dtype=np.int64))
+
+
+def _replay_chunk(matches, ks, contrasts):
+    """Replay the matches once for every (k, contrast) pair at the same time. Returns (log_loss, brier) per pair.
+
+    Extreme pairs can overflow the bonus (a huge K against a tiny CONTRAST);
+    from then on their ratings mean nothing, so they score inf.
+    """
+    players_1, players_2, scores_1, scores_2, k_factors, initial = matches
+    # One row per armwrestler, one column per parameter pair, so each match reads and writes two contiguous rows
+    ratings = np.repeat(initial[:, None], len(ks), axis=1)
+    log_loss, brier = np.zeros(len(ks)), np.zeros(len(ks))
+    overflowed = np.zeros(len(ks), dtype=bool)
+
+    with np.errstate(over='ignore', invalid='ignore', divide='ignore'):
+        for player_1, player_2, score_1, score_2, k_factor in zip(players_1, players_2, scores_1, scores_2, k_factors):
+            elos_1, elos_2 = ratings[player_1], ratings[player_2]
+            expected = np.clip(expected_score_batch(elos_1, elos_2, contrasts)[0], LOG_LOSS_EPSILON, 1 - LOG_LOSS_EPSILON)
+            actual = score_1 / (score_1 + score_2)
+            log_loss -= actual * np.log(expected) + (1 - actual) * np.log(1 - expected)
+            brier += (expected - actual) ** 2
+
+            bonus_1, bonus_2 = add_bonus_batch(elos_1, elos_2, (score_1, score_2), contrasts)
+            overflowed |= ~np.isfinite(bonus_1 + bonus_2)
+            # Keep the overflowed pairs on plain scores so their (discarded) ratings stay finite
+            bonus_1, bonus_2 = np.where(overflowed, score_1, bonus_1), np.where(overflowed, score_2, bonus_2)
+            ratings[player_1], ratings[player_2] = calculate_elo_batch(elos_1, elos_2, (bonus_1, bonus_2), ks * k_factor, contrasts)
+
+    count = max(len(players_1), 1)
+    return np.where(overflowed, np.inf, log_loss / count), np.where(overflowed, np.inf, brier / count)
+
+
+def parameter_grid(ks, contrasts):
+    """Every combination of the given K and CONTRAST values, as two flat arrays."""
+    grid_ks, grid_contrasts = np.meshgrid(np.asarray(ks, dtype=float), np.asarray(contrasts, dtype=float), indexing='ij')
+    return grid_ks.ravel(), grid_contrasts.ravel()
+
+
+def backtest(matches, ks, contrasts, workers=None):
+    """Score the rating system on the history for every (ks[i], contrasts[i]) pair.
+
+    Before each match the expected score is compared with the share of rounds
+    actually won, averaged over all matches as log-loss and Brier score (lower
+    is better). The pairs are split over a process pool of `workers` processes
+    (all cores by default, 1 to stay in this process). Returns (log_loss, brier).
+    """
+    ks, contrasts = np.asarray(ks, dtype=float), np.asarray(contrasts, dtype=float)
+    workers = workers or os.cpu_count() or 1
+    chunks = np.array_split(np.arange(len(ks)), min(workers, len(ks)) or 1)
+
+    if workers == 1 or len(chunks) == 1:
+        results = [_replay_chunk(matches, ks[chunk], contrasts[chunk]) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_replay_chunk, [matches] * len(chunks), [ks[chunk] for chunk in chunks], [contrasts[chunk] for chunk in chunks]))
+
+    return np.concatenate([log_loss for log_loss, _ in results]), np.concatenate([brier for _, brier in results])
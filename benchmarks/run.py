@@ -0,0 +1,268 @@
+import argparse
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+parent_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(parent_dir))
+sys.path.append(os.path.join(os.path.dirname(parent_dir), 'init_matches'))
+
+from synthetic import USER, PASSWORD, create_database, add_history
+
+
+def timed(function, repeat):
+    """Call function repeat times and summarise the wall-clock times in seconds."""
+    function()
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - started)
+    times = np.array(times)
+    return {'repeat': repeat, 'mean': times.mean(), 'median': float(np.median(times)), 'p95': float(np.percentile(times, 95)), 'min': times.min()}
+
+
+def elo_benchmarks(size, seed):
+    """(name, function) pairs timing the elo.py functions on `size` random pairs of ratings."""
+    import elo
+    from formats import SUPERMATCH_FORMATS
+
+    # The same tables the app builds at startup
+    elo.build_prediction_tables({rounds for rounds, _, _ in SUPERMATCH_FORMATS.values()})
+    elo.build_scoreline_tables({(rounds, format_type) for rounds, _, format_type in SUPERMATCH_FORMATS.values()})
+
+    rng = np.random.default_rng(seed)
+    elos_a, elos_b = rng.integers(1000, 2200, size), rng.integers(1000, 2200, size)
+    rounds = rng.choice([3, 5, 7], size)
+    scores_b = rng.integers(0, rounds // 2 + 1)
+    scores = (rounds // 2 + 1, scores_b)
+    pairs = list(zip(elos_a.tolist(), elos_b.tolist()))
+    scored = list(zip(elos_a.tolist(), elos_b.tolist(), zip(scores[0].tolist(), scores_b.tolist())))
+
+    return [
+        ('elo.expected_score', lambda: [elo.expected_score(a, b) for a, b in pairs]),
+        ('elo.calculate_elo_with_bonus', lambda: [elo.calculate_elo_with_bonus(a, b, score) for a, b, score in scored]),
+        ('elo.diff_supermatch', lambda: [elo.diff_supermatch(a, b, score) for a, b, score in scored]),
+        ('elo.expected_elo_from_score', lambda: [elo.expected_elo_from_score(b, score) for _, b, score in scored]),
+        ('elo.binom_prediction', lambda: [elo.binom_prediction(a, b, 5) for a, b in pairs]),
+        ('elo.binom_prediction (no table)', lambda: [elo.binom_prediction(a + 0.5, b, 5) for a, b in pairs]),
+        ('elo.expected_score_batch', lambda: elo.expected_score_batch(elos_a, elos_b)),
+        ('elo.calculate_elo_with_bonus_batch', lambda: elo.calculate_elo_with_bonus_batch(elos_a, elos_b, scores)),
+        ('elo.diff_supermatch_batch', lambda: elo.diff_supermatch_batch(elos_a, elos_b, scores)),
+        ('elo.binom_prediction_batch', lambda: elo.binom_prediction_batch(elos_a, elos_b, rounds)),
+        ('elo.binom_prediction_outer (1000x1000)', lambda: elo.binom_prediction_outer(elos_a[:1000], elos_b[:1000], 5)),
+        ('elo.scoreline_prediction_batch (Vendetta)', lambda: elo.scoreline_prediction_batch(elos_a, elos_b, 7, 'Vendetta')),
+        ('elo.scoreline_distribution_batch (Vendetta)', lambda: elo.scoreline_distribution_batch(elo.expected_score_batch(elos_a, elos_b)[0], 7, 'Vendetta')),
+    ]
+
+
+def route_benchmarks(app, client):
+    """(name, function) pairs requesting every route through the test client.
+
+    Routes that write come last and leave the database as it was where they can.
+    """
+    from db import db_execute
+    from roster import get_roster
+    from win_matrix import MAX_MATRIX_SIZE
+
+    with app.app_context():
+        roster = get_roster()
+        names = [name for name, _ in roster.by_elo('right')]
+        middle_id, last_id = db_execute('SELECT COALESCE(MAX(id) / 2, 1), MAX(id) FROM history')[0]
+    name_1, name_2 = names[len(names) // 2], names[len(names) // 2 + 1]
+    match = {'arm': 'right', 'armwrestler1': name_1, 'armwrestler2': name_2, 'supermatch_format': 'Best of 5'}
+    pairs = [{'armwrestler1': names[index], 'armwrestler2': names[index + 1]} for index in range(min(len(names) - 1, 1000))]
+    subset = '&'.join(f'name={name}' for name in names[:min(len(names), 100)])
+    upload = 'Armwrestler1,Armwrestler2,Arm,Format,Score1,Score2\n' + f'{name_1},{name_2},right,Best of 5,3,2\n'
+
+    def login():
+        with client.session_transaction() as session:
+            session['username'] = USER
+
+    def request(method, url, expected=(200,), **kwargs):
+        def run():
+            response = client.open(url, method=method, **kwargs)
+            if response.status_code not in expected:
+                raise RuntimeError(f'{method} {url}: {response.status_code}')
+        return run
+
+    def log_in_and_out():
+        request('POST', '/login', (302,), data={'username': USER, 'password': PASSWORD})()
+        request('GET', '/logout', (302,))()
+
+    def submit_and_undo():
+        request('POST', '/supermatch', (302,), data={**match, 'score': 3, 'submit_match': '1'})()
+        request('POST', '/undo_last_match', (302,))()
+
+    def add_and_remove():
+        request('POST', '/add_new_member', (302,), data={'name': 'Benchmark Newcomer', 'right_elo': '1500', 'left_elo': '1500', 'add_member': '1'})()
+        request('POST', '/remove_member', (302,), data={'name': 'Benchmark Newcomer'})()
+
+    def import_and_undo():
+        request('POST', '/import_results', data={'results': (io.BytesIO(upload.encode()), 'results.csv')}, content_type='multipart/form-data')()
+        request('POST', '/undo_last_match', (302,))()
+
+    benchmarks = [
+        ('GET /robots.txt', request('GET', '/robots.txt')),
+        ('GET /login', request('GET', '/login')),
+        ('GET / (anonymous)', request('GET', '/')),
+        ('GET /left (anonymous)', request('GET', '/left')),
+        ('GET /sparkline/right/<name>', request('GET', f'/sparkline/right/{name_1}', headers={'HX-Request': 'true'})),
+        ('GET /wrestler/<name>', request('GET', f'/wrestler/{name_1}')),
+        ('GET /api/v1/wrestlers/<name>/timeline', request('GET', f'/api/v1/wrestlers/{name_1}/timeline')),
+        ('GET /closest_matches', request('GET', '/closest_matches')),
+        ('GET /closest_matches?exclude_days=30', request('GET', '/closest_matches?exclude_days=30')),
+        ('GET /history', request('GET', '/history')),
+        ('GET /history?name=', request('GET', f'/history?name={name_1}')),
+        ('GET /history (middle page)', request('GET', f'/history?before={middle_id}', headers={'HX-Request': 'true'})),
+        ('GET /prediction', request('GET', '/prediction', query_string=match)),
+        ('GET /elo_from_match', request('GET', '/elo_from_match', query_string={**match, 'ranked': 'ranked'})),
+        ('GET /api/v1/rankings/right', request('GET', '/api/v1/rankings/right')),
+        ('GET /api/v1/ratings', request('GET', '/api/v1/ratings')),
+        ('POST /api/v1/predictions (1000 pairs)', request('POST', '/api/v1/predictions', json={'pairs': pairs})),
+        ('GET /api/v1/win_matrix/right (100 names)', request('GET', f'/api/v1/win_matrix/right?{subset}')),
+        ('POST /update_name', request('POST', '/update_name', data={'name': 'Newcomer'})),
+        ('POST /login + GET /logout', log_in_and_out),
+        ('login', login),
+        ('GET / (logged in)', request('GET', '/')),
+        ('GET /supermatch', request('GET', '/supermatch')),
+        ('POST /supermatch (preview)', request('POST', '/supermatch', data=match, headers={'HX-Request': 'true'})),
+        ('GET /add_new_member', request('GET', '/add_new_member')),
+        ('POST /add_new_member (preview)', request('POST', '/add_new_member', data={'name': 'Newcomer', 'armwrestler2': name_2, 'arm': 'right'}, headers={'HX-Request': 'true'})),
+        ('POST /confirm_remove', request('POST', f'/confirm_remove?name={name_1}')),
+        ('GET /import_results', request('GET', '/import_results')),
+        ('GET /edit_match/<id>', request('GET', f'/edit_match/{middle_id}')),
+        ('POST /supermatch + POST /undo_last_match', submit_and_undo),
+        ('POST /add_new_member + POST /remove_member', add_and_remove),
+        ('POST /import_results + POST /undo_last_match', import_and_undo),
+        ('POST /edit_match/<id> (last match)', request('POST', f'/edit_match/{last_id}', (302,), data={'score_1': 3, 'score_2': 2, 'supermatch_format': 'Best of 5'})),
+        ('POST /edit_match/<id> (middle match)', request('POST', f'/edit_match/{middle_id}', (302,), data={'score_1': 3, 'score_2': 2, 'supermatch_format': 'Best of 5'})),
+    ]
+    if len(names) <= MAX_MATRIX_SIZE:
+        benchmarks.insert(17, ('GET /api/v1/win_matrix/right (full)', request('GET', '/api/v1/win_matrix/right')))
+    return benchmarks
+
+
+def calibration_benchmarks(app, epochs, seed):
+    """Time process_matches.calibrate on the right arm history."""
+    from db import db_execute
+    from process_matches import calibrate
+
+    with app.app_context():
+        matches = db_execute("SELECT armwrestler1_name, armwrestler2_name, armwrestler1_score, armwrestler2_score FROM history WHERE arm = 'right'")
+        ratings = dict(db_execute('SELECT name, right_elo FROM armwrestlers'))
+    return [(f'process_matches.calibrate ({epochs} epochs)', lambda: calibrate(matches, ratings, epochs=epochs, seed=seed))]
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, cwd=parent_dir, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path, threshold):
+    with open(baseline_path, encoding='utf-8') as file:
+        baseline = json.load(file)['results']
+    print(f'\nCompared with {baseline_path} (median, slower than {threshold:.2f}x marked):')
+    for name, stats in results.items():
+        if 'error' in stats or 'error' in baseline.get(name, {}):
+            print(f'! {name:<50} {stats.get("error") or "fixed"}')
+        elif name in baseline:
+            ratio = stats['median'] / baseline[name]['median']
+            print(f'{"!" if ratio > threshold else " "} {name:<50} {ratio:6.2f}x')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the elo functions, the routes and the calibration on a synthetic club.')
+    parser.add_argument('--wrestlers', type=int, default=1000, help='armwrestlers in the synthetic database (1k to 100k)')
+    parser.add_argument('--matches', type=int, default=10000, help='history rows in the synthetic database (10k to 1M)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--database', help='benchmark a copy of this database instead of a synthetic one')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--elo-size', type=int, default=10000, help='rating pairs per elo function call')
+    parser.add_argument('--epochs', type=int, default=2, help='calibration epochs')
+    parser.add_argument('--only', choices=['elo', 'routes', 'calibration'], action='append', help='run only these groups')
+    parser.add_argument('--output', help='results file, by default benchmarks/results/<commit>-<wrestlers>-<matches>.json')
+    parser.add_argument('--compare', help='earlier results file to compare with')
+    parser.add_argument('--threshold', type=float, default=1.2)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='armelo-benchmark-')
+    database = os.path.join(workdir, 'database.db')
+    if args.database:
+        shutil.copyfile(args.database, database)
+    else:
+        create_database(database, args.wrestlers, args.seed)
+
+    from db import standalone_app, write_transaction, close_thread_connections
+    from formats import SUPERMATCH_FORMATS
+    from migrations import init_schema
+
+    setup_app = standalone_app(database)
+    init_schema(setup_app)
+    started = time.perf_counter()
+    if not args.database:
+        with setup_app.app_context():
+            write_transaction(add_history, args.matches, SUPERMATCH_FORMATS, args.seed)
+    generated = time.perf_counter() - started
+
+    groups = args.only or ['elo', 'routes', 'calibration']
+    benchmarks = []
+    if 'elo' in groups:
+        benchmarks += elo_benchmarks(args.elo_size, args.seed)
+    if 'routes' in groups:
+        # Only the routes need the web app itself; its log goes into the work directory
+        os.environ['DATABASE'] = database
+        os.environ['LOG_FILE'] = os.path.join(workdir, 'armelo_app.log')
+        from armelo_app import app
+        app.logger.setLevel('WARNING')
+        benchmarks += route_benchmarks(app, app.test_client())
+    if 'calibration' in groups:
+        benchmarks += calibration_benchmarks(setup_app, args.epochs, args.seed)
+
+    results = {}
+    try:
+        for name, function in benchmarks:
+            if name == 'login':
+                function()
+                continue
+            repeat = 3 if name.startswith(('process_matches', 'POST /login')) else args.repeat
+            try:
+                results[name] = timed(function, repeat)
+            except RuntimeError as error:
+                # A broken route is recorded, not timed, so it shows up in the comparison
+                results[name] = {'error': str(error)}
+                print(f'{name:<52} failed: {error}')
+                continue
+            print(f'{name:<52} median {results[name]["median"] * 1000:10.3f} ms   p95 {results[name]["p95"] * 1000:10.3f} ms')
+    finally:
+        close_thread_connections()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    commit = git_commit()
+    output = args.output or os.path.join(parent_dir, 'results', f'{commit or "unknown"}-{args.wrestlers}-{args.matches}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as file:
+        json.dump({
+            'commit': commit,
+            'date': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'parameters': {**vars(args), 'generation_seconds': generated},
+            'results': {name: {key: float(value) if key not in ('repeat', 'error') else value for key, value in stats.items()} for name, stats in results.items()},
+        }, file, indent=2)
+    print(f'\nResults written to {output}')
+
+    if args.compare:
+        compare(results, args.compare, args.threshold)
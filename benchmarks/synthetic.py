@@ -0,0 +1,196 @@
+import argparse
+import json
+import os
+import sqlite3
+import sys
+
+import numpy as np
+
+parent_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(parent_dir))
+
+from db import connect
+
+# The tables that predate the migrations, as they are in database.db
+BASE_SCHEMA = [
+    '''CREATE TABLE users (
+    username TEXT PRIMARY KEY,
+    password_hash TEXT NOT NULL
+)''',
+    '''CREATE TABLE armwrestlers (
+    name TEXT PRIMARY KEY,
+    right_elo INTEGER NOT NULL,
+    left_elo INTEGER NOT NULL,
+    added_by TEXT NOT NULL,
+    FOREIGN KEY (added_by) REFERENCES users(username)
+)''',
+    '''CREATE TABLE history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    armwrestler1_name TEXT NOT NULL,
+    armwrestler2_name TEXT NOT NULL,
+    arm TEXT NOT NULL CHECK (arm IN ('right', 'left')),
+    armwrestler1_rank INTEGER NOT NULL,
+    armwrestler2_rank INTEGER NOT NULL,
+    armwrestler1_elo INTEGER NOT NULL,
+    armwrestler2_elo INTEGER NOT NULL,
+    armwrestler1_score INTEGER NOT NULL,
+    armwrestler2_score INTEGER NOT NULL,
+    armwrestler1_elo_diff INTEGER NOT NULL,
+    armwrestler2_elo_diff INTEGER NOT NULL,
+    selected_format TEXT NOT NULL,
+    date DATETIME DEFAULT CURRENT_TIMESTAMP,
+    added_by TEXT NOT NULL,
+    FOREIGN KEY (armwrestler1_name) REFERENCES armwrestlers(name),
+    FOREIGN KEY (armwrestler2_name) REFERENCES armwrestlers(name),
+    FOREIGN KEY (added_by) REFERENCES users(username)
+)''',
+]
+
+USER = 'benchmark'
+# Password of the benchmark user, for logging in through the login form
+PASSWORD = 'benchmark'
+
+
+def strengths(wrestlers, seed):
+    """True strength of every synthetic armwrestler; the same for a given seed whatever else is generated."""
+    rng = np.random.default_rng([seed, 0])
+    return rng.normal(1500, 200, (wrestlers, 2)).round()
+
+
+def create_database(path, wrestlers, seed=0):
+    """Create a database with the base tables, a benchmark user and `wrestlers` armwrestlers.
+
+    Starting ratings are the true strengths plus noise, so the history added
+    by add_history moves them around like real results would.
+    """
+    from werkzeug.security import generate_password_hash
+
+    if os.path.exists(path):
+        raise FileExistsError(path)
+    rng = np.random.default_rng([seed, 1])
+    elos = (strengths(wrestlers, seed) + rng.normal(0, 100, (wrestlers, 2))).round().astype(int)
+    db = connect(path)
+    try:
+        for statement in BASE_SCHEMA:
+            db.execute(statement)
+        db.execute('BEGIN')
+        db.execute('INSERT INTO users (username, password_hash) VALUES (?, ?)', (USER, generate_password_hash(PASSWORD)))
+        db.executemany('INSERT INTO armwrestlers (name, right_elo, left_elo, added_by) VALUES (?, ?, ?, ?)',
+                       ((f'Armwrestler {index:06d}', int(right_elo), int(left_elo), USER) for index, (right_elo, left_elo) in enumerate(elos)))
+        db.execute('COMMIT')
+    except sqlite3.DatabaseError:
+        db.close()
+        os.remove(path)
+        raise
+    db.close()
+
+
+def _scores(rounds, format_types, expected, rng):
+    """Sample a scoreline for every match, round by round with the given chance of armwrestler 1 winning a round."""
+    max_rounds = rounds.max()
+    won = rng.random((len(expected), max_rounds)) < expected[:, None]
+    scores_1 = np.cumsum(won, axis=1)
+    scores_2 = np.arange(1, max_rounds + 1) - scores_1
+    played = rounds.copy()
+
+    # Best of: stop as soon as someone has the wins required
+    wins_required = rounds // 2 + 1
+    best_of = format_types == 'Best of'
+    decided = (scores_1 >= wins_required[:, None]) | (scores_2 >= wins_required[:, None])
+    played[best_of] = decided[best_of].argmax(axis=1) + 1
+
+    # Vendetta: all rounds but the last one, which only settles a draw
+    vendetta = format_types == 'Vendetta'
+    regular = rounds - 1
+    drawn = scores_1[np.arange(len(expected)), regular - 1] * 2 == regular
+    played[vendetta & ~drawn] = regular[vendetta & ~drawn]
+
+    score_1 = scores_1[np.arange(len(expected)), played - 1]
+    return score_1, played - score_1
+
+
+def add_history(matches, supermatch_formats, seed=0, snapshots=10):
+    """Add `matches` synthetic supermatches to the history and bring everything derived from it up to date.
+
+    Opponents are close in true strength, arms and formats are random and
+    every round is won according to the elo model on the true strengths.
+    The ratings are replayed with the app's own code, so the history is
+    consistent with them. Ranks are the ranks before the first match.
+    Must run inside a write transaction in the app context.
+    """
+    from db import db_execute, get_db, bump_data_version
+    from elo import expected_score_batch
+    from match_log import replay, record_timeline
+    from matchmaking import dense_ranks
+
+    rng = np.random.default_rng([seed, 2])
+    armwrestlers = db_execute('SELECT name, right_elo, left_elo FROM armwrestlers ORDER BY name')
+    names = [name for name, _, _ in armwrestlers]
+    true_elos = strengths(len(names), seed)
+
+    arms = rng.integers(0, 2, matches)
+    by_strength = np.argsort(true_elos, axis=0)
+    positions = rng.integers(0, len(names), matches)
+    offsets = rng.integers(1, 21, matches) * rng.choice([-1, 1], matches)
+    opponent_positions = np.clip(positions + offsets, 0, len(names) - 1)
+    opponent_positions[opponent_positions == positions] = np.where(positions[opponent_positions == positions] == 0, 1, positions[opponent_positions == positions] - 1)
+    first, second = by_strength[positions, arms], by_strength[opponent_positions, arms]
+
+    format_names = list(supermatch_formats)
+    formats = rng.integers(0, len(format_names), matches)
+    rounds = np.array([supermatch_formats[name][0] for name in format_names])[formats]
+    format_types = np.array([supermatch_formats[name][2] for name in format_names])[formats]
+    expected = expected_score_batch(true_elos[first, arms], true_elos[second, arms])[0]
+    scores_1, scores_2 = _scores(rounds, format_types, expected, rng)
+
+    first_id = db_execute('SELECT COALESCE(MAX(id), 0) + 1 FROM history')[0][0]
+    k_by_format = {name: k for name, (_, k, _) in supermatch_formats.items()}
+    results, snapshot_rows = {}, []
+    for column, arm in enumerate(['right', 'left']):
+        ratings = {row[0]: row[column + 1] for row in armwrestlers}
+        by_elo = sorted(names, key=lambda name: -ratings[name])
+        ranks = dict(zip(by_elo, dense_ranks([ratings[name] for name in by_elo])))
+        arm_matches = [(int(first_id + index), names[first[index]], names[second[index]], int(scores_1[index]), int(scores_2[index]), format_names[formats[index]])
+                       for index in np.flatnonzero(arms == column)]
+        chunk = max(len(arm_matches) // max(snapshots, 1), 1)
+        for start in range(0, len(arm_matches), chunk):
+            for match_id, elo_1, elo_2, diff_1, diff_2 in replay(arm_matches[start:start + chunk], ratings, k_by_format):
+                results[match_id] = (ranks[names[first[match_id - first_id]]], ranks[names[second[match_id - first_id]]], elo_1, elo_2, diff_1, diff_2)
+            snapshot_rows.append((arm, arm_matches[min(start + chunk, len(arm_matches)) - 1][0], json.dumps(ratings)))
+        get_db().executemany(f'UPDATE armwrestlers SET {arm}_elo = ? WHERE name = ?', [(elo, name) for name, elo in ratings.items()])
+
+    seconds = np.sort(rng.integers(0, 3 * 365 * 24 * 3600, matches))
+    get_db().executemany('''
+    INSERT INTO history (
+    id, armwrestler1_name, armwrestler2_name, arm, selected_format,
+    armwrestler1_rank, armwrestler2_rank, armwrestler1_elo, armwrestler2_elo,
+    armwrestler1_score, armwrestler2_score, armwrestler1_elo_diff, armwrestler2_elo_diff,
+    date, added_by )
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, datetime('now', '-3 years', ? || ' seconds'), ?)
+    ''', ((first_id + index, names[first[index]], names[second[index]], 'right' if arms[index] == 0 else 'left', format_names[formats[index]],
+           *results[first_id + index][:4], int(scores_1[index]), int(scores_2[index]), *results[first_id + index][4:], int(seconds[index]), USER)
+          for index in range(matches)))
+    get_db().executemany('INSERT INTO rating_snapshots (arm, history_id, ratings) VALUES (?, ?, ?)', snapshot_rows)
+    for arm in ['right', 'left']:
+        record_timeline(arm, first_id)
+    bump_data_version()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate a synthetic club database for benchmarks.')
+    parser.add_argument('database', help='path of the new database')
+    parser.add_argument('--wrestlers', type=int, default=1000)
+    parser.add_argument('--matches', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    create_database(args.database, args.wrestlers, args.seed)
+    from db import standalone_app, write_transaction
+    from formats import SUPERMATCH_FORMATS
+    from migrations import init_schema
+
+    app = standalone_app(args.database)
+    init_schema(app)
+    with app.app_context():
+        write_transaction(add_history, args.matches, SUPERMATCH_FORMATS, args.seed)
+    print(f'Created {args.database} with {args.wrestlers} armwrestlers and {args.matches} matches.')
@@ -0,0 +1,107 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from elo import binom_prediction_outer, expected_score_batch
+
+
+def seeding_order(size):
+    """Seeds in bracket order for a bracket of size slots (a power of two), so 1 and 2 can only meet in the final."""
+    order = [1]
+    while len(order) < size:
+        order = [seed for top in order for seed in (top, 2 * len(order) + 1 - top)]
+    return order
+
+
+def advance_matrix(elos, rounds):
+    """Chance of every entrant getting past every other one in a match of `rounds` rounds.
+
+    A drawn match (even number of rounds) is settled by one more round. The
+    last row and column stand for a bye, which always loses.
+    """
+    won = binom_prediction_outer(elos, elos, rounds)
+    expected = expected_score_batch(np.asarray(elos, dtype=float)[:, None], np.asarray(elos, dtype=float)[None, :])[0]
+    count = len(elos)
+    advance = np.ones((count + 1, count + 1))
+    advance[:count, :count] = won + (1 - won - won.T) * expected
+    advance[count, :count] = 0
+    return advance
+
+
+def _play(advance, first, second, rng):
+    """Play the matches first[:, i] against second[:, i] in every run. Returns (winners, losers)."""
+    first_wins = rng.random(first.shape) < advance[first, second]
+    return np.where(first_wins, first, second), np.where(first_wins, second, first)
+
+
+def _simulate_chunk(advance, runs, double_elimination, seed):
+    """Run `runs` tournaments and count how often each entrant reached each stage. Returns (stages, counts)."""
+    rng = np.random.default_rng(seed)
+    count = len(advance) - 1
+    size = 1 << max(count - 1, 1).bit_length()
+    slots = np.array([position - 1 if position <= count else count for position in seeding_order(size)])
+    winners = np.tile(slots, (runs, 1))
+    stages, counts = [], []
+
+    def reached(stage, entrants):
+        stages.append(stage)
+        counts.append(np.bincount(entrants.ravel(), minlength=count + 1)[:count])
+
+    losers_bracket, losers_rounds = None, 0
+    bracket_rounds = size.bit_length() - 1
+    for bracket_round in range(1, bracket_rounds + 1):
+        if double_elimination:
+            reached(f'W{bracket_round}', winners)
+        else:
+            reached('Final' if winners.shape[1] == 2 else f'Round of {winners.shape[1]}', winners)
+        winners, losers = _play(advance, winners[:, 0::2], winners[:, 1::2], rng)
+        if not double_elimination:
+            continue
+
+        if losers_bracket is None:
+            losers_bracket = losers
+        else:
+            # Drop the losers in in reverse order so they do not meet the same opponents again straight away
+            losers_rounds += 1
+            reached(f'L{losers_rounds}', np.hstack([losers_bracket, losers]))
+            losers_bracket = _play(advance, losers_bracket, losers[:, ::-1], rng)[0]
+        if losers_bracket.shape[1] > 1:
+            losers_rounds += 1
+            reached(f'L{losers_rounds}', losers_bracket)
+            losers_bracket = _play(advance, losers_bracket[:, 0::2], losers_bracket[:, 1::2], rng)[0]
+
+    if double_elimination:
+        reached('Grand final', np.hstack([winners, losers_bracket]))
+        champion = _play(advance, winners, losers_bracket, rng)[0]
+        # The winners bracket champion has to lose twice, so a loss to the losers bracket champion means a rematch
+        reset = champion != winners
+        rematch = _play(advance, winners, losers_bracket, rng)[0]
+        winners = np.where(reset, rematch, champion)
+    reached('Winner', winners)
+    return stages, np.array(counts)
+
+
+def simulate_tournaments(elos, rounds, runs=100000, double_elimination=False, workers=None, seed=None):
+    """Monte Carlo simulation of an elimination bracket.
+
+    elos are in seed order (the first one is the top seed) and every match
+    has `rounds` rounds. The runs are split over a process pool of `workers`
+    processes (all cores by default, 1 to stay in this process). Returns
+    (stages, probabilities) where probabilities[s, i] is the chance of
+    entrant i reaching stage s.
+    """
+    advance = advance_matrix(elos, rounds)
+    workers = workers or os.cpu_count() or 1
+    chunks = min(workers * 4, max(runs // 10000, 1))
+    chunk_runs = [runs // chunks + (1 if chunk < runs % chunks else 0) for chunk in range(chunks)]
+    seeds = np.random.SeedSequence(seed).spawn(chunks)
+
+    if workers == 1 or chunks == 1:
+        results = [_simulate_chunk(advance, chunk, double_elimination, chunk_seed) for chunk, chunk_seed in zip(chunk_runs, seeds)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_simulate_chunk, [advance] * chunks, chunk_runs, [double_elimination] * chunks, seeds))
+
+    stages = results[0][0]
+    return stages, sum(counts for _, counts in results) / runs
@@ -0,0 +1,166 @@
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import Flask, g, current_app, request, has_request_context
+
+# Applied to every new connection. WAL lets readers keep reading while a
+# writer commits, and with WAL synchronous=NORMAL is still safe against
+# corruption (a power cut can only lose the last commits).
+PRAGMAS = (
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA cache_size = -16000',
+    'PRAGMA mmap_size = 268435456',
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA busy_timeout = 5000',
+)
+
+_local = threading.local()
+
+
+def connect(database):
+    db = sqlite3.connect(database, isolation_level=None)
+    for pragma in PRAGMAS:
+        db.execute(pragma)
+    return db
+
+
+def _thread_connection(database):
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+    db = connections.get(database)
+    if db is None:
+        db = connections[database] = connect(database)
+    return db
+
+
+def get_db():
+    db = getattr(g, '_database', None)
+    if db is None:
+        started = time.perf_counter()
+        db = g._database = _thread_connection(current_app.config['DATABASE'])
+        g._db_stats = {'connect_time': time.perf_counter() - started, 'queries': 0, 'query_time': 0.0,
+                       'path': request.path if has_request_context() else '-'}
+    return db
+
+
+def db_execute(query, *args):
+    db = get_db()
+    started = time.perf_counter()
+    cur = db.cursor()
+    cur.execute(query, args)
+    if query.strip().upper().startswith(("SELECT", "WITH", "PRAGMA")):
+        rv = cur.fetchall()
+    else:
+        rv = None
+    cur.close()
+    g._db_stats['queries'] += 1
+    g._db_stats['query_time'] += time.perf_counter() - started
+    return rv
+
+
+@contextmanager
+def transaction(immediate=False):
+    """Run the statements in the block as one transaction.
+
+    Connections are in autocommit mode, so outside of this block every
+    statement commits on its own. Nested blocks join the outer transaction.
+    """
+    db = get_db()
+    if db.in_transaction:
+        yield db
+        return
+
+    db.execute('BEGIN IMMEDIATE' if immediate else 'BEGIN')
+    try:
+        yield db
+    except BaseException:
+        db.execute('ROLLBACK')
+        raise
+    db.execute('COMMIT')
+
+
+def _is_busy(error):
+    code = getattr(error, 'sqlite_errorcode', None)
+    if code is not None:
+        return code & 0xff in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+    return 'database is locked' in str(error)
+
+
+def write_transaction(work, *args, retries=5, **kwargs):
+    """Run work(*args, **kwargs) in a BEGIN IMMEDIATE transaction and return its result.
+
+    The write lock is taken before anything is read, so work sees the latest
+    committed data and no other writer can change it before the commit. If the
+    database stays busy past busy_timeout, the whole transaction is retried
+    with a jittered backoff.
+    """
+    delay = 0.05
+    for attempt in range(retries + 1):
+        try:
+            with transaction(immediate=True):
+                return work(*args, **kwargs)
+        except sqlite3.OperationalError as error:
+            if attempt == retries or not _is_busy(error):
+                raise
+            time.sleep(delay * (1 + random.random()))
+            delay *= 2
+
+
+def release_db(exception=None):
+    """Hand the connection back to its thread at the end of the app context.
+
+    Unfinished transactions are rolled back. After an error the connection
+    is closed so the next request starts with a fresh one.
+    """
+    db = g.pop('_database', None)
+    if db is None:
+        return
+
+    if db.in_transaction:
+        db.execute('ROLLBACK')
+    if exception is not None:
+        close_thread_connections()
+
+    stats = g.pop('_db_stats')
+    current_app.logger.debug('%s: %s queries in %.2f ms (connect %.2f ms)', stats['path'], stats['queries'], stats['query_time'] * 1000, stats['connect_time'] * 1000)
+
+
+def close_thread_connections():
+    for db in getattr(_local, 'connections', {}).values():
+        db.close()
+    _local.connections = {}
+
+
+def get_data_version(fresh=False):
+    """(version, updated_at) of the data, bumped by every write that changes ratings or the roster."""
+    version = getattr(g, '_data_version', None)
+    if version is None or fresh:
+        version = g._data_version = tuple(db_execute('SELECT version, updated_at FROM data_version WHERE id = 1')[0])
+    return version
+
+
+def bump_data_version():
+    db_execute("UPDATE data_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP WHERE id = 1")
+    g.pop('_data_version', None)
+
+
+def init_db(app):
+    app.config.setdefault('DATABASE', 'database.db')
+    app.teardown_appcontext(release_db)
+
+
+def standalone_app(database):
+    """A bare app for scripts that work on the database outside of the web app.
+
+    Only sets up the connections: no logging, metrics, migrations or
+    prediction tables.
+    """
+    app = Flask(__name__)
+    app.config['DATABASE'] = database
+    init_db(app)
+    return app
@@ -1,8 +1,19 @@
 import math
-from scipy.stats import binom
+import numpy as np
 
 CONTRAST = 400
 K = 128
+PREDICTION_TABLE_MAX_DIFF = 2000
+SCORELINE_GRID_STEP = 5
+
+# rounds -> win probabilities of armwrestler a for elo differences a - b
+# from -PREDICTION_TABLE_MAX_DIFF to PREDICTION_TABLE_MAX_DIFF
+_prediction_tables = {}
+
+# (max_rounds, format_type) -> (scorelines, probabilities of each scoreline for the elo
+# differences a - b from -PREDICTION_TABLE_MAX_DIFF to PREDICTION_TABLE_MAX_DIFF in
+# steps of SCORELINE_GRID_STEP)
+_scoreline_tables = {}
 
 
 def expected_score(armwrestler_a_elo, armwrestler_b_elo, c=CONTRAST):
@@ -69,13 +80,202 @@ def calculate_elo_with_bonus(armwrestler_a_elo, armwrestler_b_elo, actual_score,
     return updated_a_elo, updated_b_elo
 
 
+def win_probability(expected, rounds):
+    """Chance of winning more than half of the rounds, each won with probability `expected`."""
+    return sum(math.comb(rounds, won) * expected ** won * (1 - expected) ** (rounds - won) for won in range(rounds // 2 + 1, rounds + 1))
+
+
 def binom_prediction(armwrestler_a_elo, armwrestler_b_elo, rounds=5):
+    table = _prediction_tables.get(rounds)
+    diff = armwrestler_a_elo - armwrestler_b_elo
+    if table is not None and diff == int(diff) and abs(diff) <= PREDICTION_TABLE_MAX_DIFF:
+        return float(table[int(diff) + PREDICTION_TABLE_MAX_DIFF]), float(table[PREDICTION_TABLE_MAX_DIFF - int(diff)])
+
     expected_a, expected_b = expected_score(armwrestler_a_elo, armwrestler_b_elo, CONTRAST)
-    no_win_rounds = rounds // 2
+    predicted_a = win_probability(expected_a, rounds)
+    predicted_b = win_probability(expected_b, rounds)
+
+    return predicted_a, predicted_b
+
+
+def build_prediction_tables(rounds_values):
+    """Precompute binom_prediction for every integer elo difference and each number of rounds."""
+    diffs = np.arange(-PREDICTION_TABLE_MAX_DIFF, PREDICTION_TABLE_MAX_DIFF + 1)
+    for rounds in rounds_values:
+        _prediction_tables[rounds] = binom_prediction_batch(diffs, 0, rounds)[0]
+
+# Batch versions of the functions above. They take NumPy arrays (or anything
+# array-like) of ratings and scores and give the same results as the scalar
+# functions applied element by element. Scores are passed as a pair of arrays
+# (scores_a, scores_b), the same way the scalar functions take a tuple.
+
+def expected_score_batch(armwrestler_a_elos, armwrestler_b_elos, c=CONTRAST):
+    armwrestler_a_elos = np.asarray(armwrestler_a_elos, dtype=float)
+    armwrestler_b_elos = np.asarray(armwrestler_b_elos, dtype=float)
+    expected_a = 1 / (1 + np.power(10.0, (armwrestler_b_elos - armwrestler_a_elos) / c))
+    expected_b = 1 - expected_a
+
+    return expected_a, expected_b
+
+
+def calculate_elo_batch(armwrestler_a_elos, armwrestler_b_elos, actual_scores, k=K, c=CONTRAST):
+    armwrestler_a_elos = np.asarray(armwrestler_a_elos)
+    armwrestler_b_elos = np.asarray(armwrestler_b_elos)
+    scores_a, scores_b = (np.asarray(scores, dtype=float) for scores in actual_scores)
+    total_rounds = scores_a + scores_b
+    actual_a = scores_a / total_rounds
+    actual_b = scores_b / total_rounds
+
+    expected_a, expected_b = expected_score_batch(armwrestler_a_elos, armwrestler_b_elos, c)
+
+    updated_a_elos = np.rint(armwrestler_a_elos + k * (actual_a - expected_a)).astype(np.int64)
+    updated_b_elos = np.rint(armwrestler_b_elos + k * (actual_b - expected_b)).astype(np.int64)
+
+    return updated_a_elos, updated_b_elos
+
+
+def expected_elo_from_score_batch(armwrestler_b_elos, actual_scores, c=CONTRAST):
+    """Return float ratings, NaN where the score is a whitewash (None in the scalar version)."""
+    armwrestler_b_elos = np.asarray(armwrestler_b_elos, dtype=float)
+    scores_a, scores_b = (np.asarray(scores, dtype=float) for scores in actual_scores)
+    actual_a = scores_a / (scores_a + scores_b)
+    decided = (actual_a == 1) | (actual_a == 0)
+    safe_a = np.where(decided, 0.5, actual_a)
+
+    armwrestler_a_elos = np.rint(-c * np.log10((1 - safe_a) / safe_a) + armwrestler_b_elos)
+
+    return np.where(decided, np.nan, armwrestler_a_elos)
+
+
+def add_bonus_batch(armwrestler_a_elos, armwrestler_b_elos, actual_scores, c=CONTRAST):
+    scores_a, scores_b = (np.asarray(scores, dtype=float) for scores in actual_scores)
+    total_rounds = scores_a + scores_b
+    expected_a, expected_b = expected_score_batch(armwrestler_a_elos, armwrestler_b_elos, c)
+    actual_a = scores_a / total_rounds
+    actual_b = scores_b / total_rounds
+
+    scores_a = scores_a * np.exp(np.where(actual_a > expected_a, (actual_a / expected_a - 1) / 3, 0))
+    scores_b = scores_b * np.exp(np.where(actual_b > expected_b, (actual_b / expected_b - 1) / 3, 0))
+
+    return scores_a, scores_b
+
+
+def calculate_elo_with_bonus_batch(armwrestler_a_elos, armwrestler_b_elos, actual_scores, k=K, c=CONTRAST):
+    with_bonus_scores = add_bonus_batch(armwrestler_a_elos, armwrestler_b_elos, actual_scores, c)
 
-    cumulative_prob_not_winning_a = binom.cdf(no_win_rounds, rounds, expected_a)
-    cumulative_prob_not_winning_b = binom.cdf(no_win_rounds, rounds, expected_b)
-    predicted_a = 1 - cumulative_prob_not_winning_a
-    predicted_b = 1 - cumulative_prob_not_winning_b
+    return calculate_elo_batch(armwrestler_a_elos, armwrestler_b_elos, with_bonus_scores, k, c)
+
+
+def diff_supermatch_batch(armwrestler_a_elos, armwrestler_b_elos, actual_scores, k=K, c=CONTRAST):
+    updated_a_elos, updated_b_elos = calculate_elo_with_bonus_batch(armwrestler_a_elos, armwrestler_b_elos, actual_scores, k, c)
+
+    diff_a_elos = updated_a_elos - np.asarray(armwrestler_a_elos)
+    diff_b_elos = updated_b_elos - np.asarray(armwrestler_b_elos)
+
+    return diff_a_elos, diff_b_elos
+
+
+def win_probability_batch(expected, rounds):
+    expected = np.asarray(expected, dtype=float)
+    rounds = np.broadcast_to(rounds, expected.shape)
+    predicted = np.zeros(expected.shape)
+    for total in np.unique(rounds):
+        total = int(total)
+        selected = rounds == total
+        for won in range(total // 2 + 1, total + 1):
+            predicted[selected] += math.comb(total, won) * expected[selected] ** won * (1 - expected[selected]) ** (total - won)
+    return predicted
+
+
+def binom_prediction_batch(armwrestler_a_elos, armwrestler_b_elos, rounds=5):
+    expected_a, expected_b = expected_score_batch(armwrestler_a_elos, armwrestler_b_elos, CONTRAST)
+
+    predicted_a = win_probability_batch(expected_a, rounds)
+    predicted_b = win_probability_batch(expected_b, rounds)
 
     return predicted_a, predicted_b
+
+
+def binom_prediction_outer(armwrestler_a_elos, armwrestler_b_elos, rounds=5):
+    """Win probability of every a against every b, as a len(a) x len(b) array.
+
+    Reads the precomputed table when it covers all the elo differences.
+    """
+    diffs = np.subtract.outer(np.asarray(armwrestler_a_elos, dtype=float), np.asarray(armwrestler_b_elos, dtype=float))
+    table = _prediction_tables.get(rounds)
+    if table is not None and (not diffs.size or (np.abs(diffs).max() <= PREDICTION_TABLE_MAX_DIFF and np.array_equal(diffs, np.rint(diffs)))):
+        return table[diffs.astype(int) + PREDICTION_TABLE_MAX_DIFF]
+
+    return win_probability_batch(expected_score_batch(diffs, 0)[0], rounds)
+
+
+# Distribution of the final score of a supermatch under the rules of its
+# format (see match_result in armelo_app.py), every round being won by a with
+# its expected score:
+#   "Best of":    first to win more than half of max_rounds, a draw when an
+#                 even number of rounds is used up
+#   "All rounds": all max_rounds rounds are pulled
+#   "Vendetta":   max_rounds - 1 rounds, plus one more round on a tie
+
+def match_over(score_a, score_b, max_rounds, format_type):
+    rounds = score_a + score_b
+    if format_type == "Best of":
+        return max(score_a, score_b) > max_rounds // 2 or rounds == max_rounds
+    if format_type == "Vendetta":
+        return (rounds == max_rounds - 1 and score_a != score_b) or rounds == max_rounds
+    return rounds == max_rounds
+
+
+def scoreline_distribution_batch(expected, max_rounds, format_type):
+    """Probability of every final scoreline, going round by round through the possible scores.
+
+    Returns (scorelines, probabilities) with the scorelines as (score_a, score_b)
+    tuples, a's best result first, and probabilities[i] the chances of
+    scorelines[i] for each element of expected.
+    """
+    expected = np.asarray(expected, dtype=float)
+    finished = {}
+    scores = {(0, 0): np.ones(expected.shape)}
+    while scores:
+        next_scores = {}
+        for (score_a, score_b), probability in scores.items():
+            if match_over(score_a, score_b, max_rounds, format_type):
+                finished[score_a, score_b] = probability
+                continue
+            for scoreline, won in (((score_a + 1, score_b), expected), ((score_a, score_b + 1), 1 - expected)):
+                next_scores[scoreline] = next_scores.get(scoreline, 0) + probability * won
+        scores = next_scores
+
+    scorelines = sorted(finished, key=lambda scoreline: (scoreline[1] - scoreline[0], scoreline[1]))
+    return scorelines, np.array([finished[scoreline] for scoreline in scorelines])
+
+
+def build_scoreline_tables(formats):
+    """Precompute scoreline_distribution_batch on the elo difference grid for each (max_rounds, format_type)."""
+    diffs = np.arange(-PREDICTION_TABLE_MAX_DIFF, PREDICTION_TABLE_MAX_DIFF + 1, SCORELINE_GRID_STEP)
+    for max_rounds, format_type in formats:
+        _scoreline_tables[max_rounds, format_type] = scoreline_distribution_batch(expected_score_batch(diffs, 0)[0], max_rounds, format_type)
+
+
+def scoreline_prediction_batch(armwrestler_a_elos, armwrestler_b_elos, max_rounds, format_type):
+    """Scoreline odds for many matches of one format. Returns (scorelines, probabilities) like scoreline_distribution_batch.
+
+    Interpolates linearly in the precomputed table, so differences beyond
+    PREDICTION_TABLE_MAX_DIFF get the odds of the edge of the table.
+    """
+    diffs = np.asarray(armwrestler_a_elos, dtype=float) - np.asarray(armwrestler_b_elos, dtype=float)
+    table = _scoreline_tables.get((max_rounds, format_type))
+    if table is None:
+        return scoreline_distribution_batch(expected_score_batch(diffs, 0)[0], max_rounds, format_type)
+
+    scorelines, probabilities = table
+    position = np.clip((diffs + PREDICTION_TABLE_MAX_DIFF) / SCORELINE_GRID_STEP, 0, probabilities.shape[1] - 1)
+    lower = np.minimum(position.astype(int), probabilities.shape[1] - 2)
+    weight = position - lower
+    return scorelines, probabilities[:, lower] * (1 - weight) + probabilities[:, lower + 1] * weight
+
+
+def scoreline_prediction(armwrestler_a_elo, armwrestler_b_elo, max_rounds, format_type):
+    """List of ((score_a, score_b), probability), a's best result first."""
+    scorelines, probabilities = scoreline_prediction_batch(armwrestler_a_elo, armwrestler_b_elo, max_rounds, format_type)
+    return [(scoreline, float(probability)) for scoreline, probability in zip(scorelines, probabilities)]
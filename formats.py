@@ -0,0 +1,12 @@
+# name -> [max_rounds, k, format_type]; the format types are played out in match_result (armelo_app.py)
+SUPERMATCH_FORMATS = {
+    "Single round": [1, 64, "Best of"],
+    "Best of 3": [3, 96, "Best of"],
+    "Best of 5": [5, 128, "Best of"],
+    "5 round match": [5, 144, "All rounds"],
+    "6 round Vendetta": [6 + 1, 144, "Vendetta"],
+    "Best of 7": [7, 144, "Best of"],
+    "10 round Speculative": [10, 128, "All rounds"],
+}
+
+K_BY_FORMAT = {supermatch_format: k for supermatch_format, (_, k, _) in SUPERMATCH_FORMATS.items()}
@@ -0,0 +1,132 @@
+import csv
+from datetime import datetime
+
+from db import get_db, bump_data_version
+from elo import calculate_elo_with_bonus
+from match_log import record_timeline, snapshot_if_due
+from roster import get_roster
+
+COLUMNS = ['Armwrestler1', 'Armwrestler2', 'Arm', 'Format', 'Score1', 'Score2', 'Date']
+
+
+class ResultsImportError(ValueError):
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__(f'{len(errors)} invalid rows: ' + '; '.join(errors[:5]))
+
+
+def parse_results(lines, supermatch_formats):
+    """Parse result rows from CSV lines one at a time.
+
+    Yields (line, armwrestler1, armwrestler2, arm, format, score1, score2, date)
+    for valid rows and (line, error) for invalid ones. The Date column is
+    optional and is normalised to the format SQLite's CURRENT_TIMESTAMP uses.
+    """
+    reader = csv.DictReader(lines)
+    missing = [column for column in COLUMNS[:-1] if column not in (reader.fieldnames or [])]
+    if missing:
+        yield 1, 'Missing columns: ' + ', '.join(missing)
+        return
+
+    for row in reader:
+        line = reader.line_num
+        armwrestler_1, armwrestler_2 = row['Armwrestler1'].strip(), row['Armwrestler2'].strip()
+        arm, selected_format = row['Arm'].strip().lower(), row['Format'].strip()
+        date = (row.get('Date') or '').strip() or None
+        if date:
+            try:
+                date = datetime.fromisoformat(date).strftime('%Y-%m-%d %H:%M:%S')
+            except ValueError:
+                yield line, f'line {line}: invalid date "{date}"'
+                continue
+
+        if arm not in ['right', 'left']:
+            yield line, f'line {line}: unknown arm "{arm}"'
+            continue
+        if selected_format not in supermatch_formats:
+            yield line, f'line {line}: unknown format "{selected_format}"'
+            continue
+        if not armwrestler_1 or armwrestler_1 == armwrestler_2:
+            yield line, f'line {line}: two different armwrestlers are needed'
+            continue
+        max_rounds = supermatch_formats[selected_format][0]
+        try:
+            armwrestler_1_score, armwrestler_2_score = int(row['Score1']), int(row['Score2'])
+            if not (0 <= armwrestler_1_score <= max_rounds and 0 <= armwrestler_2_score <= max_rounds and (0 < (armwrestler_1_score + armwrestler_2_score) <= max_rounds)):
+                raise ValueError
+        except (ValueError, TypeError):
+            yield line, f'line {line}: invalid score for {selected_format}'
+            continue
+
+        yield line, armwrestler_1, armwrestler_2, arm, selected_format, armwrestler_1_score, armwrestler_2_score, date
+
+
+def import_results(lines, current_user, supermatch_formats):
+    """Validate and apply a CSV of results in one transaction. Returns the number of matches imported.
+
+    Results are applied after the existing history in chronological order: by
+    Date if every row has one, otherwise in file order. Nothing is written if
+    any row is invalid. Must run inside a write transaction.
+    """
+    roster = get_roster(fresh=True)
+    results, errors = [], []
+    for parsed in parse_results(lines, supermatch_formats):
+        if len(parsed) == 2:
+            errors.append(parsed[1])
+            continue
+        unknown = [name for name in parsed[1:3] if name not in roster]
+        if unknown:
+            errors.append(f'line {parsed[0]}: unknown armwrestler ' + ', '.join(unknown))
+            continue
+        results.append(parsed)
+    dated = sum(1 for result in results if result[7])
+    if dated and dated != len(results):
+        errors.append('Date must be given for every row or for none')
+    if errors:
+        raise ResultsImportError(errors)
+    if dated:
+        results.sort(key=lambda result: result[7])
+
+    working = roster.updated(roster.version + 1, {})
+    history_rows = []
+    for _, armwrestler_1, armwrestler_2, arm, selected_format, armwrestler_1_score, armwrestler_2_score, date in results:
+        column = 0 if arm == 'right' else 1
+        armwrestler_1_elo, armwrestler_2_elo = working.ratings[armwrestler_1][column], working.ratings[armwrestler_2][column]
+        updated_1, updated_2 = calculate_elo_with_bonus(armwrestler_1_elo, armwrestler_2_elo, (armwrestler_1_score, armwrestler_2_score), supermatch_formats[selected_format][1])
+
+        history_rows.append((armwrestler_1, armwrestler_2, arm, selected_format,
+                             working.rank(armwrestler_1, arm), working.rank(armwrestler_2, arm),
+                             armwrestler_1_elo, armwrestler_2_elo,
+                             armwrestler_1_score, armwrestler_2_score,
+                             updated_1 - armwrestler_1_elo, updated_2 - armwrestler_2_elo,
+                             date, current_user))
+
+        changes = {}
+        for name, updated in ((armwrestler_1, updated_1), (armwrestler_2, updated_2)):
+            elos = list(working.ratings[name])
+            elos[column] = updated
+            changes[name] = tuple(elos)
+        working.apply(changes)
+
+    db = get_db()
+    first_id = db.execute('SELECT COALESCE(MAX(id), 0) + 1 FROM history').fetchone()[0]
+    db.executemany('''
+    INSERT INTO history (
+    armwrestler1_name, armwrestler2_name,
+    arm,
+    selected_format,
+    armwrestler1_rank, armwrestler2_rank,
+    armwrestler1_elo, armwrestler2_elo,
+    armwrestler1_score, armwrestler2_score,
+    armwrestler1_elo_diff, armwrestler2_elo_diff,
+    date, added_by )
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP), ?)
+    ''', history_rows)
+    changed = {name for row in history_rows for name in row[:2]}
+    db.executemany('UPDATE armwrestlers SET right_elo = ?, left_elo = ? WHERE name = ?', [(*working.ratings[name], name) for name in changed])
+    bump_data_version()
+    for arm in {row[2] for row in history_rows}:
+        record_timeline(arm, first_id)
+        snapshot_if_due(arm)
+
+    return len(history_rows)
@@ -0,0 +1,71 @@
+import argparse
+import os
+import sys
+import time
+
+parent_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(parent_dir))
+
+import numpy as np
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replay the match history under a grid of K and CONTRAST values and rank them by log-loss and Brier score.')
+    parser.add_argument('--arm', choices=['right', 'left', 'both'], default='both')
+    parser.add_argument('--k', type=float, nargs=3, default=(32, 256, 4), metavar=('START', 'STOP', 'STEP'),
+                        help='K values to try (STOP included); the K of every format is scaled alike')
+    parser.add_argument('--contrast', type=float, nargs=3, default=(200, 800, 10), metavar=('START', 'STOP', 'STEP'),
+                        help='CONTRAST values to try (STOP included)')
+    parser.add_argument('--metric', choices=['log_loss', 'brier'], default='log_loss', help='metric the settings are ranked by')
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--workers', type=int, default=None, help='process pool size, all cores by default')
+    parser.add_argument('--database', default='../database.db')
+    args = parser.parse_args()
+
+    from backtest import backtest, parameter_grid, prepare_matches
+    from db import db_execute, standalone_app
+    from elo import K, CONTRAST
+    from formats import K_BY_FORMAT
+
+    def values(start, stop, step):
+        return np.arange(start, stop + step / 2, step)
+
+    ks, contrasts = parameter_grid(values(*args.k), values(*args.contrast))
+    # The settings in use are always scored, to compare against
+    current = np.flatnonzero((ks == K) & (contrasts == CONTRAST))
+    if not len(current):
+        ks, contrasts = np.append(ks, K), np.append(contrasts, CONTRAST)
+    current = np.flatnonzero((ks == K) & (contrasts == CONTRAST))[0]
+
+    arms = ['right', 'left'] if args.arm == 'both' else [args.arm]
+    with standalone_app(args.database).app_context():
+        histories = {arm: db_execute('''SELECT armwrestler1_name, armwrestler2_name, armwrestler1_elo, armwrestler2_elo, armwrestler1_score, armwrestler2_score, selected_format
+                                        FROM history WHERE arm = ? ORDER BY id''', arm) for arm in arms}
+
+    started = time.perf_counter()
+    total = {'log_loss': np.zeros(len(ks)), 'brier': np.zeros(len(ks))}
+    count = 0
+    for arm in arms:
+        matches = prepare_matches(histories[arm], K_BY_FORMAT)
+        if not len(matches[0]):
+            continue
+        log_loss, brier = backtest(matches, ks, contrasts, args.workers)
+        # Weighted by the number of matches, so both arms together score like one history
+        total['log_loss'] += log_loss * len(matches[0])
+        total['brier'] += brier * len(matches[0])
+        count += len(matches[0])
+    if not count:
+        print('No matches in the history.')
+        sys.exit(1)
+    log_loss, brier = total['log_loss'] / count, total['brier'] / count
+
+    print(f'{count} matches ({", ".join(arms)} arm), {len(ks)} settings in {time.perf_counter() - started:.1f} s\n')
+    print(f'{"K":>7}  {"CONTRAST":>8}  {"Log-loss":>9}  {"Brier":>8}')
+    ranked = np.argsort(log_loss if args.metric == 'log_loss' else brier, kind='stable')
+    for index in ranked[:args.top]:
+        print(f'{ks[index]:>7g}  {contrasts[index]:>8g}  {log_loss[index]:>9.5f}  {brier[index]:>8.5f}')
+    print(f'\nCurrent settings (K {K}, CONTRAST {CONTRAST}): log-loss {log_loss[current]:.5f}, Brier {brier[current]:.5f}')
+
+    best = ranked[0]
+    print(f'Best settings (K {ks[best]:g}, CONTRAST {contrasts[best]:g}) give these format K values:')
+    for supermatch_format, k in K_BY_FORMAT.items():
+        print(f'    {supermatch_format}: {round(k * ks[best] / K)}')
@@ -0,0 +1,31 @@
+import argparse
+import os
+import sys
+
+parent_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(parent_dir))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Import tournament results from a CSV file.')
+    parser.add_argument('input', help='CSV with Armwrestler1, Armwrestler2, Arm, Format, Score1, Score2 and optionally Date')
+    parser.add_argument('--user', required=True, help='username recorded as added_by')
+    parser.add_argument('--database', default='../database.db')
+    args = parser.parse_args()
+
+    from db import standalone_app, write_transaction
+    from formats import SUPERMATCH_FORMATS
+    from importer import import_results, ResultsImportError
+    from migrations import init_schema
+
+    app = standalone_app(args.database)
+    # Importing writes the history and the rating timeline, so the schema has to be current
+    init_schema(app)
+    with app.app_context(), open(args.input, mode='r', encoding='utf-8-sig', newline='') as file:
+        try:
+            imported = write_transaction(import_results, file, args.user, SUPERMATCH_FORMATS)
+            print(f'Imported {imported} matches.')
+        except ResultsImportError as error:
+            print('Nothing was imported:')
+            for row_error in error.errors:
+                print(' ', row_error)
+            sys.exit(1)
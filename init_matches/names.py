@@ -1,17 +1,62 @@
+import argparse
 import csv
-from itertools import permutations
+import os
+from contextlib import ExitStack
+from itertools import combinations, islice, permutations
 
-with open('names.csv', 'r', newline='', encoding='utf-8') as csvfile:
-    reader = csv.reader(csvfile)
-    next(reader)
-    names = [' '.join(row) for row in reader]
 
-pairs = list(permutations(names, 2))
+def read_names(file_path):
+    with open(file_path, 'r', newline='', encoding='utf-8') as csvfile:
+        reader = csv.reader(csvfile)
+        next(reader)
+        return [' '.join(row) for row in reader]
 
-with open('output.csv', 'w', newline='', encoding='utf-8') as csvfile:
-    writer = csv.writer(csvfile)
-    writer.writerow(['Armwrestler1', 'Armwrestler2', 'Score1', 'Score2'])
-    for pair in pairs:
-        writer.writerow([pair[0], pair[1], '', ''])
 
-print(f'{len(pairs)} matches kurva.')
+def pairs(names, unordered=False):
+    """Every pairing of the names, generated lazily. Unordered gives each pair once instead of in both orders."""
+    return combinations(names, 2) if unordered else permutations(names, 2)
+
+
+def shard_paths(output, shards, referees=None):
+    stem, extension = os.path.splitext(output)
+    if referees:
+        return [f'{stem}_{referee}{extension}' for referee in referees]
+    if shards == 1:
+        return [output]
+    return [f'{stem}_{shard}{extension}' for shard in range(1, shards + 1)]
+
+
+def write_pair_sheets(pairs, paths, chunk_size=10000):
+    """Deal the pairs round-robin over one pair sheet per path, writing chunk_size pairs at a time. Returns the number of pairs."""
+    count = 0
+    with ExitStack() as stack:
+        writers = []
+        for path in paths:
+            writer = csv.writer(stack.enter_context(open(path, 'w', newline='', encoding='utf-8')))
+            writer.writerow(['Armwrestler1', 'Armwrestler2', 'Score1', 'Score2'])
+            writers.append(writer)
+
+        while True:
+            chunk = list(islice(pairs, chunk_size))
+            if not chunk:
+                break
+            for shard, writer in enumerate(writers):
+                writer.writerows([armwrestler_1, armwrestler_2, '', ''] for armwrestler_1, armwrestler_2 in chunk[(shard - count) % len(writers)::len(writers)])
+            count += len(chunk)
+    return count
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write pair sheets with every pairing of the armwrestlers in a names CSV.')
+    parser.add_argument('input', nargs='?', default='names.csv')
+    parser.add_argument('--output', default='output.csv')
+    parser.add_argument('--unordered', action='store_true', help='each pair once instead of in both orders')
+    parser.add_argument('--shards', type=int, default=1, help='split the pairs over this many sheets, e.g. one per referee')
+    parser.add_argument('--referees', nargs='+', help='one sheet per referee, named after them (instead of --shards)')
+    parser.add_argument('--chunk-size', type=int, default=10000, help='pairs buffered per write')
+    args = parser.parse_args()
+
+    paths = shard_paths(args.output, max(args.shards, 1), args.referees)
+    count = write_pair_sheets(pairs(read_names(args.input), args.unordered), paths, args.chunk_size)
+
+    print(f'{count} matches kurva.')
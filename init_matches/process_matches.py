@@ -1,14 +1,18 @@
+import argparse
 import csv
+import json
 import sqlite3
 import random
 import sys
 import os
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 
 parent_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(os.path.dirname(parent_dir))
 
 from elo import calculate_elo
+from migrations import migrate
 
 DATABASE = '../database.db'
 db_connection = None
@@ -59,6 +63,7 @@ def process_matches(matches):
 
         if all(record[2].isdigit() and record[3].isdigit() for record in records):
             total_score1, total_score2 = 0, 0
+            check_consensus = {}
             for record in records:
                 armwrestler1, armwrestler2, score1, score2 = record
                 if armwrestler1 == key[0]:
@@ -66,18 +71,19 @@ def process_matches(matches):
                         print("Wrong data: ", record)
                     total_score1 += float(score1)
                     total_score2 += float(score2)
-                    check_consensus1 = float(score1)
+                    check_consensus[1] = float(score1)
                 else:
                     if float(score1) + float(score2) != 10:
                         print("Wrong data: ", record)
                     total_score1 += float(score2)
                     total_score2 += float(score1)
-                    check_consensus2 = float(score2)
-            avg_score1 = total_score1 / 2
-            avg_score2 = total_score2 / 2
+                    check_consensus[2] = float(score2)
+            # Sheets from names.py --unordered have each pair once, so there is only one record to average
+            avg_score1 = total_score1 / len(records)
+            avg_score2 = total_score2 / len(records)
 
-            if abs(check_consensus1 - check_consensus2) > 1:
-                print(records, "DIFF:", abs(check_consensus1 - check_consensus2))
+            if len(check_consensus) == 2 and abs(check_consensus[1] - check_consensus[2]) > 1:
+                print(records, "DIFF:", abs(check_consensus[1] - check_consensus[2]))
 
             processed_matches.append([key[0], key[1], f"{avg_score1:.1f}", f"{avg_score2:.1f}"])
         else:
@@ -97,24 +103,62 @@ def write_csv(file_path, matches):
         csv_writer.writerows(matches)
 
 
-def supermatch(armwrestler_1, armwrestler_2, armwrestler_1_score, armwrestler_2_score, k, arm='right'):
+def load_ratings(arm='right'):
+    """Load the current ratings for one arm into a name -> elo dict."""
+    dbarm = 'right_elo' if arm == 'right' else 'left_elo'
+    return dict(db_execute(f'SELECT name, {dbarm} FROM armwrestlers'))
+
 
+def save_ratings(ratings, arm='right'):
+    """Write all ratings back to the database in a single transaction."""
     dbarm = 'right_elo' if arm == 'right' else 'left_elo'
+    db = get_db()
     try:
-        db_execute("BEGIN;")
+        with db:
+            db.executemany(f"UPDATE armwrestlers SET {dbarm} = ? WHERE name = ?", [(elo, name) for name, elo in ratings.items()])
+            db.execute("UPDATE data_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP WHERE id = 1")
+            # Calibration changes ratings outside of the match history, so later replays must start from here
+            db.execute("INSERT INTO rating_snapshots (arm, history_id, ratings, kind) SELECT ?, COALESCE(MAX(id), 0), ?, 'calibration' FROM history", (arm, json.dumps(ratings)))
+    except sqlite3.DatabaseError as error:
+        print(error)
 
-        armwrestler_1_elo = db_execute(f'SELECT {dbarm} FROM armwrestlers WHERE name = ?', armwrestler_1)[0][0]
-        armwrestler_2_elo = db_execute(f'SELECT {dbarm} FROM armwrestlers WHERE name = ?', armwrestler_2)[0][0]
 
-        updated_1, updated_2 = calculate_elo(armwrestler_1_elo, armwrestler_2_elo, (float(armwrestler_1_score), float(armwrestler_2_score)), k)
+def known_matches(matches, ratings):
+    """Drop matches with armwrestlers that are not in the database."""
+    known = []
+    for match in matches:
+        if match[0] in ratings and match[1] in ratings:
+            known.append((match[0], match[1], float(match[2]), float(match[3])))
+        else:
+            print("Unknown armwrestler: ", match)
+    return known
 
-        db_execute(f"UPDATE armwrestlers SET {dbarm} = ? WHERE name = ?", updated_1, armwrestler_1)
-        db_execute(f"UPDATE armwrestlers SET {dbarm} = ? WHERE name = ?", updated_2, armwrestler_2)
 
-        db_execute("COMMIT;", commit=True)
-    except sqlite3.DatabaseError as error:
-        print(error)
-        db_execute("ROLLBACK;", commit=True)
+def calibrate(matches, ratings, epochs=256, k=64, decay_every=4, seed=None, verbose=False):
+    """Run shuffled epochs over the matches in memory and return the final ratings."""
+    rng = random.Random(seed)
+    ratings = dict(ratings)
+    matches = list(matches)
+
+    for i in range(epochs):
+        if verbose:
+            print('Current K: ', k)
+        if (i + 1) % decay_every == 0:
+            k -= 1
+        rng.shuffle(matches)
+        for armwrestler_1, armwrestler_2, armwrestler_1_score, armwrestler_2_score in matches:
+            ratings[armwrestler_1], ratings[armwrestler_2] = calculate_elo(ratings[armwrestler_1], ratings[armwrestler_2], (armwrestler_1_score, armwrestler_2_score), k)
+
+    return ratings
+
+
+def calibrate_seeds(matches, ratings, seeds, workers=None, **kwargs):
+    """Calibrate once per seed on a process pool and average the resulting ratings."""
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(calibrate, matches, ratings, seed=seed, **kwargs) for seed in seeds]
+        results = [future.result() for future in futures]
+
+    return {name: round(sum(result[name] for result in results) / len(results)) for name in ratings}
 
 
 def close_db():
@@ -125,19 +169,30 @@ def close_db():
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Calibrate ratings from a CSV of matches.')
+    parser.add_argument('input', nargs='?', default='input_matches_main_left.csv')
+    parser.add_argument('--output', default='output_matches_main.csv')
+    parser.add_argument('--arm', choices=['right', 'left'], default='left')
+    parser.add_argument('--epochs', type=int, default=256)
+    parser.add_argument('--k', type=int, default=64, help='starting K, decreased by one every --decay-every epochs')
+    parser.add_argument('--decay-every', type=int, default=4)
+    parser.add_argument('--seeds', type=int, default=1, help='number of random seeds to average')
+    parser.add_argument('--workers', type=int, default=None, help='process pool size when --seeds > 1')
+    args = parser.parse_args()
+
     try:
-        input_file_path = 'input_matches_main_left.csv'
-        matches = read_csv(input_file_path)
+        matches = read_csv(args.input)
         processed_matches = process_matches(matches)
-        write_csv('output_matches_main.csv', processed_matches)
-
-        k = 64
-        for i in range(256):
-            print('Current K: ', k)
-            if (i + 1) % 4 == 0:
-                k -= 1
-            random.shuffle(processed_matches)
-            for match in processed_matches:
-                supermatch(match[0], match[1], match[2], match[3], k, 'left')
+        write_csv(args.output, processed_matches)
+
+        migrate(get_db())
+        ratings = load_ratings(args.arm)
+        processed_matches = known_matches(processed_matches, ratings)
+        options = dict(epochs=args.epochs, k=args.k, decay_every=args.decay_every)
+        if args.seeds > 1:
+            ratings = calibrate_seeds(processed_matches, ratings, range(args.seeds), args.workers, **options)
+        else:
+            ratings = calibrate(processed_matches, ratings, verbose=True, **options)
+        save_ratings(ratings, args.arm)
     finally:
         close_db()
@@ -0,0 +1,51 @@
+import argparse
+import os
+import sys
+
+parent_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(parent_dir))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Simulate an elimination bracket with the current ratings.')
+    parser.add_argument('input', help='text file with one armwrestler per line, top seed first')
+    parser.add_argument('--arm', choices=['right', 'left'], default='right')
+    parser.add_argument('--format', default='Best of 5', help='supermatch format of every match')
+    parser.add_argument('--double', action='store_true', help='double elimination instead of single elimination')
+    parser.add_argument('--seed-by-elo', action='store_true', help='seed by current elo instead of the order in the file')
+    parser.add_argument('--runs', type=int, default=100000)
+    parser.add_argument('--workers', type=int, default=None, help='process pool size, all cores by default')
+    parser.add_argument('--seed', type=int, default=None, help='random seed for a repeatable simulation')
+    parser.add_argument('--database', default='../database.db')
+    args = parser.parse_args()
+
+    from bracket import simulate_tournaments
+    from db import standalone_app
+    from formats import SUPERMATCH_FORMATS
+    from migrations import init_schema
+    from roster import get_ratings, UnknownArmwrestlerError
+
+    if args.format not in SUPERMATCH_FORMATS:
+        parser.error(f'unknown format "{args.format}", choose from: ' + ', '.join(SUPERMATCH_FORMATS))
+    with open(args.input, mode='r', encoding='utf-8-sig') as file:
+        names = [line.strip() for line in file if line.strip()]
+    if len(names) < 2 or len(set(names)) != len(names):
+        parser.error('the bracket needs at least two different armwrestlers')
+
+    app = standalone_app(args.database)
+    # The roster reads data_version, which only exists once the schema is migrated
+    init_schema(app)
+    with app.app_context():
+        try:
+            elos = get_ratings(names, args.arm)
+        except UnknownArmwrestlerError as error:
+            print(error)
+            sys.exit(1)
+    if args.seed_by_elo:
+        names, elos = zip(*sorted(zip(names, elos), key=lambda entrant: -entrant[1]))
+
+    stages, probabilities = simulate_tournaments(elos, SUPERMATCH_FORMATS[args.format][0], args.runs, args.double, args.workers, args.seed)
+
+    width = max(len(name) for name in names)
+    print(f'{"Seed":>4}  {"Armwrestler":<{width}}  {"Elo":>5}' + ''.join(f'  {stage:>11}' for stage in stages))
+    for position in sorted(range(len(names)), key=lambda entrant: -probabilities[-1, entrant]):
+        print(f'{position + 1:>4}  {names[position]:<{width}}  {elos[position]:>5}' + ''.join(f'  {probability:>11.2%}' for probability in probabilities[:, position]))
@@ -0,0 +1,135 @@
+import json
+
+from db import db_execute, get_db, bump_data_version
+from elo import calculate_elo_with_bonus
+
+# A snapshot of an arm's ratings is taken after this many matches on that arm
+SNAPSHOT_INTERVAL = 100
+
+
+class CalibratedHistoryError(ValueError):
+    def __init__(self, match_id, calibrated_after):
+        self.match_id = match_id
+        self.calibrated_after = calibrated_after
+        super().__init__(f'Match {match_id} was played before the ratings were calibrated after match {calibrated_after}')
+
+
+def replay(matches, ratings, k_by_format):
+    """Apply matches in order to a name -> elo dict and return the recomputed history columns.
+
+    matches are (id, name1, name2, score1, score2, format) tuples. ratings is
+    updated in place. Returns (id, elo1, elo2, diff1, diff2) for every match.
+    """
+    results = []
+    for match_id, armwrestler_1, armwrestler_2, armwrestler_1_score, armwrestler_2_score, selected_format in matches:
+        armwrestler_1_elo, armwrestler_2_elo = ratings[armwrestler_1], ratings[armwrestler_2]
+        updated_1, updated_2 = calculate_elo_with_bonus(armwrestler_1_elo, armwrestler_2_elo, (armwrestler_1_score, armwrestler_2_score), k_by_format[selected_format])
+        ratings[armwrestler_1], ratings[armwrestler_2] = updated_1, updated_2
+        results.append((match_id, armwrestler_1_elo, armwrestler_2_elo, updated_1 - armwrestler_1_elo, updated_2 - armwrestler_2_elo))
+    return results
+
+
+def take_snapshot(arm):
+    """Store the arm's current ratings as the state after the latest history row."""
+    dbarm = 'right_elo' if arm == 'right' else 'left_elo'
+    ratings = dict(db_execute(f'SELECT name, {dbarm} FROM armwrestlers'))
+    db_execute('INSERT INTO rating_snapshots (arm, history_id, ratings) SELECT ?, COALESCE(MAX(id), 0), ? FROM history', arm, json.dumps(ratings))
+
+
+def snapshot_if_due(arm):
+    last = db_execute('SELECT COALESCE(MAX(history_id), 0) FROM rating_snapshots WHERE arm = ?', arm)[0][0]
+    since = db_execute('SELECT COUNT(*) FROM (SELECT 1 FROM history WHERE arm = ? AND id > ? LIMIT ?)', arm, last, SNAPSHOT_INTERVAL)[0][0]
+    if since >= SNAPSHOT_INTERVAL:
+        take_snapshot(arm)
+
+
+def record_timeline(arm, first_id):
+    """Add the ratings after each history row on arm from first_id onwards to the rating timeline."""
+    db_execute('''INSERT INTO rating_timeline (name, arm, history_id, elo, date)
+                  SELECT armwrestler1_name, arm, id, armwrestler1_elo + armwrestler1_elo_diff, date FROM history WHERE arm = ? AND id >= ?
+                  UNION ALL
+                  SELECT armwrestler2_name, arm, id, armwrestler2_elo + armwrestler2_elo_diff, date FROM history WHERE arm = ? AND id >= ?''',
+               arm, first_id, arm, first_id)
+
+
+def rating_timeline(name, arm, since=None, until=None):
+    """(history_id, elo, date) after each of an armwrestler's matches on arm, oldest first.
+
+    since and until are dates (YYYY-MM-DD), both inclusive.
+    """
+    conditions, args = ['name = ?', 'arm = ?'], [name, arm]
+    if since:
+        conditions.append('date >= ?')
+        args.append(since)
+    if until:
+        conditions.append("date < date(?, '+1 day')")
+        args.append(until)
+    return db_execute(f'SELECT history_id, elo, date FROM rating_timeline WHERE {" AND ".join(conditions)} ORDER BY history_id', *args)
+
+
+def recent_ratings(name, arm, points=20):
+    """Elos after the last `points` matches of name on arm, oldest first. Reads only those rows through the primary key."""
+    rows = db_execute('SELECT elo FROM rating_timeline WHERE name = ? AND arm = ? ORDER BY history_id DESC LIMIT ?', name, arm, points)
+    return [elo for elo, in reversed(rows)]
+
+
+def rebuild_from(arm, match_id, k_by_format, removed=()):
+    """Recompute ratings and history for an arm from match_id onwards.
+
+    Starts from the latest snapshot before match_id (or from the beginning if
+    there is none) and replays only the matches after it. Anyone missing from
+    the snapshot starts with the elo stored in their first match after it.
+    History rows in `removed` are still used for those starting elos, which
+    matters when an armwrestler's first match is the one being undone, but are
+    not replayed. Must run inside a write transaction.
+
+    A calibration sets ratings that no replay can reproduce, so its snapshot
+    is never deleted and a match played before it cannot be changed
+    (CalibratedHistoryError).
+    """
+    calibrated_after = db_execute("SELECT MAX(history_id) FROM rating_snapshots WHERE arm = ? AND kind = 'calibration'", arm)[0][0]
+    if calibrated_after is not None and match_id <= calibrated_after:
+        raise CalibratedHistoryError(match_id, calibrated_after)
+
+    dbarm = 'right_elo' if arm == 'right' else 'left_elo'
+    snapshot = db_execute('SELECT history_id, ratings FROM rating_snapshots WHERE arm = ? AND history_id < ? ORDER BY history_id DESC LIMIT 1', arm, match_id)
+    snapshot_id, ratings = (snapshot[0][0], json.loads(snapshot[0][1])) if snapshot else (0, {})
+
+    rows = db_execute('''SELECT id, armwrestler1_name, armwrestler2_name, armwrestler1_score, armwrestler2_score, selected_format,
+                         armwrestler1_elo, armwrestler2_elo, armwrestler1_elo_diff, armwrestler2_elo_diff
+                         FROM history WHERE arm = ? AND id > ? ORDER BY id''', arm, snapshot_id)
+
+    touched = set()
+    for row in rows:
+        for name, elo in ((row[1], row[6]), (row[2], row[7])):
+            ratings.setdefault(name, elo)
+            touched.add(name)
+
+    removed = set(removed)
+    kept = [row for row in rows if row[0] not in removed]
+    stored = {row[0]: row[6:] for row in kept}
+    results = replay([row[:6] for row in kept], ratings, k_by_format)
+
+    db = get_db()
+    db.executemany('UPDATE history SET armwrestler1_elo = ?, armwrestler2_elo = ?, armwrestler1_elo_diff = ?, armwrestler2_elo_diff = ? WHERE id = ?',
+                   [(*result[1:], result[0]) for result in results if tuple(result[1:]) != tuple(stored[result[0]])])
+    if removed:
+        db.executemany('DELETE FROM history WHERE id = ?', [(removed_id,) for removed_id in removed])
+    db.executemany(f'UPDATE armwrestlers SET {dbarm} = ? WHERE name = ?', [(ratings[name], name) for name in touched])
+    db_execute("DELETE FROM rating_snapshots WHERE arm = ? AND history_id >= ? AND kind != 'calibration'", arm, match_id)
+    db_execute('DELETE FROM rating_timeline WHERE arm = ? AND history_id >= ?', arm, match_id)
+    record_timeline(arm, match_id)
+    bump_data_version()
+    return len(results)
+
+
+def undo_match(match_id, k_by_format):
+    arm = db_execute('SELECT arm FROM history WHERE id = ?', match_id)[0][0]
+    return rebuild_from(arm, match_id, k_by_format, removed=[match_id])
+
+
+def rescore_match(match_id, armwrestler_1_score, armwrestler_2_score, selected_format, k_by_format):
+    arm = db_execute('SELECT arm FROM history WHERE id = ?', match_id)[0][0]
+    db_execute('UPDATE history SET armwrestler1_score = ?, armwrestler2_score = ?, selected_format = ? WHERE id = ?',
+               armwrestler_1_score, armwrestler_2_score, selected_format, match_id)
+    return rebuild_from(arm, match_id, k_by_format)
@@ -0,0 +1,53 @@
+import heapq
+
+
+def dense_ranks(elos):
+    """Dense ranks for a list of elos sorted in descending order."""
+    ranks = []
+    rank, previous = 0, None
+    for elo in elos:
+        if elo != previous:
+            rank += 1
+            previous = elo
+        ranks.append(rank)
+    return ranks
+
+
+def closest_pairs(armwrestlers, count=15, window=None, exclude=()):
+    """Find the count pairs with the smallest elo difference.
+
+    armwrestlers is a list of (name, elo) sorted by elo in descending order.
+    Each armwrestler is only compared with the next `window` armwrestlers in
+    that order. Pairs in `exclude` (a collection of frozensets of two names)
+    are skipped. Without a window, the smallest window that still gives the
+    exact answer is used: count plus the most exclusions any one armwrestler
+    has.
+
+    Returns (rank1, name1, elo1, rank2, name2, elo2, elo_difference) tuples
+    with name1 < name2, closest first.
+    """
+    exclude = set(exclude)
+    if window is None:
+        excluded_per_name = {}
+        for pair in exclude:
+            for name in pair:
+                excluded_per_name[name] = excluded_per_name.get(name, 0) + 1
+        window = count + max(excluded_per_name.values(), default=0)
+
+    ranks = dense_ranks([elo for _, elo in armwrestlers])
+
+    def candidates():
+        for i, (name_a, elo_a) in enumerate(armwrestlers):
+            for j in range(i + 1, min(i + 1 + window, len(armwrestlers))):
+                name_b, elo_b = armwrestlers[j]
+                if frozenset((name_a, name_b)) in exclude:
+                    continue
+                a, b = (i, j) if name_a < name_b else (j, i)
+                yield abs(elo_a - elo_b), a, b
+
+    pairs = []
+    for elo_difference, a, b in heapq.nsmallest(count, candidates()):
+        name_a, elo_a = armwrestlers[a]
+        name_b, elo_b = armwrestlers[b]
+        pairs.append((ranks[a], name_a, elo_a, ranks[b], name_b, elo_b, elo_difference))
+    return pairs
@@ -0,0 +1,165 @@
+import functools
+import threading
+import time
+from bisect import bisect_left
+
+from flask import g, current_app, request, template_rendered, before_render_template
+
+# Metrics are kept per process; with several worker processes each one
+# serves its own numbers on /metrics.
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+_lock = threading.Lock()
+_registry = []
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + '}'
+
+
+class Counter:
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self.values = {}
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} counter']
+        lines += [f'{self.name}{_labels(key)} {value}' for key, value in sorted(self.values.items())]
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, description, buckets=DURATION_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        # labels -> [count per bucket (last one +Inf), sum]
+        self.values = {}
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with _lock:
+            series = self.values.get(key)
+            if series is None:
+                series = self.values[key] = [[0] * (len(self.buckets) + 1), 0]
+            series[0][bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} histogram']
+        for key, (counts, total) in sorted(self.values.items()):
+            cumulative = 0
+            for bucket, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{_labels(key + (("le", bucket),))} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(key)} {total}')
+            lines.append(f'{self.name}_count{_labels(key)} {cumulative}')
+        return lines
+
+
+requests_total = Counter('armelo_requests_total', 'Requests by route, method and status.')
+request_seconds = Histogram('armelo_request_duration_seconds', 'Request latency by route.')
+db_queries = Histogram('armelo_db_queries_per_request', 'SQL statements run through db_execute per request.', COUNT_BUCKETS)
+db_seconds = Histogram('armelo_db_query_duration_seconds', 'Time spent in db_execute per request.')
+template_seconds = Histogram('armelo_template_render_duration_seconds', 'Template rendering time by template.')
+function_calls = Counter('armelo_function_calls_total', 'Calls of instrumented functions.')
+function_seconds = Counter('armelo_function_duration_seconds_total', 'Time spent in instrumented functions.')
+
+
+def timed(function):
+    """Wrap function so its calls and time are counted in the function metrics."""
+    name = f'{function.__module__}.{function.__name__}'
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            function_calls.inc(function=name)
+            function_seconds.inc(time.perf_counter() - started, function=name)
+    return wrapper
+
+
+def render():
+    with _lock:
+        return '\n'.join(line for metric in _registry for line in metric.render()) + '\n'
+
+
+def _route():
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+
+def _start_request():
+    g._request_started = time.perf_counter()
+    g._template_time = 0.0
+
+
+def _finish_request(response):
+    started = g.pop('_request_started', None)
+    if started is None:
+        return response
+    duration = time.perf_counter() - started
+    route = _route()
+    requests_total.inc(route=route, method=request.method, status=response.status_code)
+    request_seconds.observe(duration, route=route, method=request.method)
+
+    stats = g.get('_db_stats', {'queries': 0, 'query_time': 0.0})
+    db_queries.observe(stats['queries'], route=route)
+    db_seconds.observe(stats['query_time'], route=route)
+
+    threshold = g.get('_slow_request_threshold')
+    if threshold is not None and duration >= threshold:
+        current_app.logger.warning('Slow request %s %s: %.1f ms, %s queries in %.1f ms, templates %.1f ms', request.method, request.full_path.rstrip('?'),
+                                   duration * 1000, stats['queries'], stats['query_time'] * 1000, g.get('_template_time', 0.0) * 1000)
+    return response
+
+
+def _start_template(sender, template, context, **extra):
+    g.setdefault('_template_started', []).append(time.perf_counter())
+
+
+def _finish_template(sender, template, context, **extra):
+    started = g.get('_template_started')
+    if not started:
+        return
+    duration = time.perf_counter() - started.pop()
+    template_seconds.observe(duration, template=template.name)
+    if not started:
+        g._template_time = g.get('_template_time', 0.0) + duration
+
+
+def init_metrics(app):
+    """Time every request, its SQL and its templates, and serve everything at /metrics.
+
+    SLOW_REQUEST_MS (off by default) logs a warning for every request that
+    takes at least that long.
+    """
+    app.config.setdefault('SLOW_REQUEST_MS', None)
+
+    @app.before_request
+    def start_request():
+        _start_request()
+        if app.config['SLOW_REQUEST_MS'] is not None:
+            g._slow_request_threshold = app.config['SLOW_REQUEST_MS'] / 1000
+
+    app.after_request(_finish_request)
+    before_render_template.connect(_start_template, app)
+    template_rendered.connect(_finish_template, app)
+
+    @app.route('/metrics')
+    def metrics():
+        return app.response_class(render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,117 @@
+import argparse
+import sqlite3
+
+from db import connect
+
+# (version, description, statements). The schema version is kept in
+# PRAGMA user_version; append new migrations with the next version number
+# and never edit one that has been released.
+MIGRATIONS = [
+    (1, 'Indexes for the roster and ranking queries, drop leftover tables', [
+        'DROP TABLE IF EXISTS new_history',
+        'DROP TABLE IF EXISTS new_armwrestlers',
+        'CREATE INDEX IF NOT EXISTS armwrestlers_lower_name ON armwrestlers (LOWER(name))',
+        'CREATE INDEX IF NOT EXISTS armwrestlers_right_elo ON armwrestlers (right_elo DESC)',
+        'CREATE INDEX IF NOT EXISTS armwrestlers_left_elo ON armwrestlers (left_elo DESC)',
+    ]),
+    (2, 'Data version counter for cache invalidation', [
+        '''CREATE TABLE IF NOT EXISTS data_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL,
+            updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )''',
+        'INSERT OR IGNORE INTO data_version (id, version) VALUES (1, 1)',
+    ]),
+    (3, 'Indexes for the history filters', [
+        'CREATE INDEX IF NOT EXISTS history_armwrestler1 ON history (armwrestler1_name, id)',
+        'CREATE INDEX IF NOT EXISTS history_armwrestler2 ON history (armwrestler2_name, id)',
+        'CREATE INDEX IF NOT EXISTS history_arm ON history (arm, id)',
+        'CREATE INDEX IF NOT EXISTS history_format ON history (selected_format, id)',
+    ]),
+    (4, 'Rating snapshots for replaying the match history', [
+        '''CREATE TABLE IF NOT EXISTS rating_snapshots (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            arm TEXT NOT NULL CHECK (arm IN ('right', 'left')),
+            history_id INTEGER NOT NULL,
+            ratings TEXT NOT NULL,
+            date DATETIME DEFAULT CURRENT_TIMESTAMP
+        )''',
+        'CREATE INDEX IF NOT EXISTS rating_snapshots_arm ON rating_snapshots (arm, history_id)',
+    ]),
+    (5, 'Rating timeline per armwrestler, backfilled from the history', [
+        '''CREATE TABLE IF NOT EXISTS rating_timeline (
+            name TEXT NOT NULL,
+            arm TEXT NOT NULL CHECK (arm IN ('right', 'left')),
+            history_id INTEGER NOT NULL,
+            elo INTEGER NOT NULL,
+            date DATETIME,
+            PRIMARY KEY (name, arm, history_id)
+        ) WITHOUT ROWID''',
+        'CREATE INDEX IF NOT EXISTS rating_timeline_arm ON rating_timeline (arm, history_id)',
+        '''INSERT OR IGNORE INTO rating_timeline (name, arm, history_id, elo, date)
+           SELECT armwrestler1_name, arm, id, armwrestler1_elo + armwrestler1_elo_diff, date FROM history
+           UNION ALL
+           SELECT armwrestler2_name, arm, id, armwrestler2_elo + armwrestler2_elo_diff, date FROM history''',
+    ]),
+    (6, 'Mark the rating snapshots written by a calibration', [
+        "ALTER TABLE rating_snapshots ADD COLUMN kind TEXT NOT NULL DEFAULT 'replay' CHECK (kind IN ('replay', 'calibration'))",
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(db):
+    return db.execute('PRAGMA user_version').fetchone()[0]
+
+
+def pending_migrations(db):
+    version = schema_version(db)
+    return [migration for migration in MIGRATIONS if migration[0] > version]
+
+
+def migrate(db, log=print):
+    """Apply pending migrations, each in its own transaction. Returns the new version."""
+    for version, description, statements in pending_migrations(db):
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            for statement in statements:
+                db.execute(statement)
+            db.execute(f'PRAGMA user_version = {version}')
+        except sqlite3.DatabaseError:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+        log(f'Migrated schema to version {version}: {description}')
+    return schema_version(db)
+
+
+def init_schema(app):
+    """Check the schema at startup and upgrade it unless AUTO_MIGRATE is off."""
+    db = connect(app.config['DATABASE'])
+    try:
+        pending = pending_migrations(db)
+        if pending and app.config.get('AUTO_MIGRATE', True):
+            migrate(db, app.logger.info)
+        elif pending:
+            app.logger.warning('Database schema is at version %s, %s migrations pending', schema_version(db), len(pending))
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check or upgrade the database schema.')
+    parser.add_argument('database', nargs='?', default='database.db')
+    parser.add_argument('--check', action='store_true', help='only report pending migrations')
+    args = parser.parse_args()
+
+    db = connect(args.database)
+    try:
+        if args.check:
+            print(f'Schema version {schema_version(db)}, latest {LATEST_VERSION}')
+            for version, description, _ in pending_migrations(db):
+                print(f'  pending {version}: {description}')
+        else:
+            migrate(db)
+    finally:
+        db.close()
@@ -0,0 +1,150 @@
+import copy
+import json
+import threading
+from bisect import bisect_left, insort
+from collections import Counter
+
+from db import db_execute, get_data_version
+from matchmaking import dense_ranks
+
+
+class UnknownArmwrestlerError(LookupError):
+    def __init__(self, names):
+        self.names = names
+        super().__init__('Unknown armwrestlers: ' + ', '.join(names))
+
+
+ARMS = ('right', 'left')
+
+
+class Roster:
+    """All armwrestlers with their ratings, as of one data version.
+
+    For each arm it also keeps the armwrestlers sorted by elo and the sorted
+    distinct elos with their counts, so dense ranks are a binary search and a
+    rating change is applied without re-sorting anything.
+    """
+
+    def __init__(self, version, rows):
+        self.version = version
+        self.ratings = {name: (right_elo, left_elo) for name, right_elo, left_elo in rows}
+        # (name,) tuples sorted like ORDER BY LOWER(name), the shape the templates expect
+        self.armwrestlers = [(name,) for name, _, _ in rows]
+        self.order = {}
+        self.counts = {}
+        self.distinct = {}
+        for column, arm in enumerate(ARMS):
+            self.order[arm] = sorted((-elos[column], name) for name, elos in self.ratings.items())
+            self.counts[arm] = Counter(elos[column] for elos in self.ratings.values())
+            self.distinct[arm] = sorted(self.counts[arm])
+        self._rankings = {}
+
+    def __contains__(self, name):
+        return name in self.ratings
+
+    def __len__(self):
+        return len(self.ratings)
+
+    def rank(self, name, arm):
+        """Dense rank of an armwrestler, the same numbering as the ranking page."""
+        elo = self.ratings[name][ARMS.index(arm)]
+        distinct = self.distinct[arm]
+        return len(distinct) - bisect_left(distinct, elo)
+
+    def by_elo(self, arm):
+        """(name, elo) pairs sorted by elo, highest first."""
+        return [(name, -negative_elo) for negative_elo, name in self.order[arm]]
+
+    def ranking(self, arm):
+        """(rank, name, elo) rows for the ranking page."""
+        ranking = self._rankings.get(arm)
+        if ranking is None:
+            armwrestlers = self.by_elo(arm)
+            ranks = dense_ranks([elo for _, elo in armwrestlers])
+            ranking = self._rankings[arm] = [(rank, name, elo) for rank, (name, elo) in zip(ranks, armwrestlers)]
+        return ranking
+
+    def updated(self, version, changes):
+        """A copy at a new version with changed (right_elo, left_elo) for some armwrestlers."""
+        roster = copy.copy(self)
+        roster.version = version
+        roster.ratings = dict(self.ratings)
+        roster.order = {arm: list(order) for arm, order in self.order.items()}
+        roster.counts = {arm: Counter(counts) for arm, counts in self.counts.items()}
+        roster.distinct = {arm: list(distinct) for arm, distinct in self.distinct.items()}
+        roster.apply(changes)
+        return roster
+
+    def apply(self, changes):
+        """Change (right_elo, left_elo) for some armwrestlers in place. Only for rosters that are not shared."""
+        self._rankings = {}
+        for name, new_elos in changes.items():
+            old_elos = self.ratings[name]
+            self.ratings[name] = new_elos
+            for column, arm in enumerate(ARMS):
+                old_elo, new_elo = old_elos[column], new_elos[column]
+                if old_elo == new_elo:
+                    continue
+                order, counts, distinct = self.order[arm], self.counts[arm], self.distinct[arm]
+                del order[bisect_left(order, (-old_elo, name))]
+                insort(order, (-new_elo, name))
+                counts[old_elo] -= 1
+                if not counts[old_elo]:
+                    del counts[old_elo]
+                    del distinct[bisect_left(distinct, old_elo)]
+                counts[new_elo] += 1
+                if counts[new_elo] == 1:
+                    insort(distinct, new_elo)
+
+
+_roster = None
+_roster_lock = threading.Lock()
+
+
+def get_roster(fresh=False):
+    """The shared roster, reloaded only when the data version has changed.
+
+    fresh re-reads the data version instead of using the one already read in
+    this request; use it inside a write transaction.
+    """
+    global _roster
+    version = get_data_version(fresh)[0]
+    roster = _roster
+    if roster is None or roster.version != version:
+        roster = _roster = Roster(version, db_execute('SELECT name, right_elo, left_elo FROM armwrestlers ORDER BY LOWER(name)'))
+    return roster
+
+
+def update_roster(version, new_version, changes):
+    """Apply rating changes committed at new_version to the shared roster, if it is still at version."""
+    global _roster
+    with _roster_lock:
+        roster = _roster
+        if roster is not None and roster.version == version:
+            _roster = roster.updated(new_version, changes)
+
+
+def _pick(names, ratings, arm):
+    unknown = list(dict.fromkeys(name for name in names if name not in ratings))
+    if unknown:
+        raise UnknownArmwrestlerError(unknown)
+
+    if arm is None:
+        return [ratings[name] for name in names]
+    column = 0 if arm == 'right' else 1
+    return [ratings[name][column] for name in names]
+
+
+def get_ratings(names, arm=None):
+    """Ratings for any number of armwrestlers from the in-memory roster, in the order asked for.
+
+    With an arm, returns that arm's elo for each name, otherwise (right_elo, left_elo) pairs.
+    Raises UnknownArmwrestlerError listing every name that is not on the roster.
+    """
+    return _pick(names, get_roster().ratings, arm)
+
+
+def fetch_ratings(names, arm=None):
+    """Same as get_ratings, but read from the database in one query (e.g. inside a write transaction)."""
+    rows = db_execute('SELECT name, right_elo, left_elo FROM armwrestlers WHERE name IN (SELECT value FROM json_each(?))', json.dumps(list(names)))
+    return _pick(names, {name: (right_elo, left_elo) for name, right_elo, left_elo in rows}, arm)
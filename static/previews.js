@@ -0,0 +1,18 @@
+// Score sliders carry the result of every position in data-previews,
+// so moving one updates the elements marked with data-preview in place.
+document.addEventListener('input', function (event) {
+    var slider = event.target;
+    if (!slider.dataset || !slider.dataset.previews) {
+        return;
+    }
+    var preview = JSON.parse(slider.dataset.previews)[slider.value];
+    var form = slider.closest('form');
+    Object.keys(preview).forEach(function (key) {
+        form.querySelectorAll('[data-preview="' + key + '"]').forEach(function (element) {
+            element.textContent = preview[key][0] === null ? '' : preview[key][0];
+            if (preview[key][1] !== null) {
+                element.className = preview[key][1];
+            }
+        });
+    });
+});
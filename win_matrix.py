@@ -0,0 +1,97 @@
+import copy
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from elo import binom_prediction_outer
+from roster import ARMS, get_roster
+
+# Rosters above this size get no shared matrix (2000 armwrestlers take 16 MB per arm and rounds)
+MAX_MATRIX_SIZE = 2000
+# Matrices kept at once, least recently used ones are dropped first
+MAX_CACHED_MATRICES = 4
+
+_matrices = OrderedDict()
+_matrices_lock = threading.Lock()
+
+
+class WinMatrix:
+    """Win probabilities between every two armwrestlers on one arm, for matches of a number of rounds.
+
+    probabilities[i, j] is the chance that names[i] beats names[j]; with an
+    even number of rounds the rest up to 1 - probabilities[j, i] is a draw.
+    Stored as float32 to keep big rosters affordable.
+    """
+
+    def __init__(self, roster, arm, rounds):
+        self.arm = arm
+        self.rounds = rounds
+        self.version = roster.version
+        self.armwrestlers = roster.armwrestlers
+        self.names = [name for (name,) in roster.armwrestlers]
+        self.index = {name: position for position, name in enumerate(self.names)}
+        self.elos = self._elos(roster)
+        self.probabilities = binom_prediction_outer(self.elos, self.elos, rounds).astype(np.float32)
+
+    def _elos(self, roster):
+        column = ARMS.index(self.arm)
+        return np.array([roster.ratings[name][column] for name in self.names], dtype=float)
+
+    def refreshed(self, roster):
+        """A copy brought up to date with roster.
+
+        Only the rows and columns of armwrestlers whose elo changed are
+        recomputed; the whole matrix is rebuilt if someone joined or left.
+        """
+        if roster.armwrestlers is not self.armwrestlers and [name for (name,) in roster.armwrestlers] != self.names:
+            return WinMatrix(roster, self.arm, self.rounds)
+
+        matrix = copy.copy(self)
+        matrix.version = roster.version
+        matrix.armwrestlers = roster.armwrestlers
+        matrix.elos = self._elos(roster)
+        changed = np.flatnonzero(matrix.elos != self.elos)
+        if changed.size:
+            matrix.probabilities = self.probabilities.copy()
+            matrix.probabilities[changed, :] = binom_prediction_outer(matrix.elos[changed], matrix.elos, self.rounds)
+            matrix.probabilities[:, changed] = binom_prediction_outer(matrix.elos, matrix.elos[changed], self.rounds)
+        return matrix
+
+    def probability(self, name_1, name_2):
+        """Chances of name_1 and of name_2 winning a match against each other."""
+        position_1, position_2 = self.index[name_1], self.index[name_2]
+        return float(self.probabilities[position_1, position_2]), float(self.probabilities[position_2, position_1])
+
+    def submatrix(self, names):
+        positions = [self.index[name] for name in names]
+        return self.probabilities[np.ix_(positions, positions)]
+
+
+def get_win_matrix(arm, rounds):
+    """The shared win matrix for an arm and number of rounds, at the current data version.
+
+    Built on first use, after that only refreshed for the ratings that changed.
+    At most MAX_CACHED_MATRICES are kept. None if the roster has more than
+    MAX_MATRIX_SIZE armwrestlers.
+    """
+    roster = get_roster()
+    if len(roster) > MAX_MATRIX_SIZE:
+        return None
+    key = (arm, rounds)
+    with _matrices_lock:
+        matrix = _matrices.get(key)
+        if matrix is not None:
+            _matrices.move_to_end(key)
+    if matrix is not None and matrix.version == roster.version:
+        return matrix
+
+    matrix = WinMatrix(roster, arm, rounds) if matrix is None else matrix.refreshed(roster)
+    with _matrices_lock:
+        current = _matrices.get(key)
+        if current is None or current.version < matrix.version:
+            _matrices[key] = matrix
+            _matrices.move_to_end(key)
+        while len(_matrices) > MAX_CACHED_MATRICES:
+            _matrices.popitem(last=False)
+    return matrix